@@ -0,0 +1,132 @@
+import os
+import shutil
+import subprocess
+from PIL import Image, GifImagePlugin
+
+# Streaming animation writers: frames are quantized/encoded and written as they
+# arrive, so only the current frame is ever held in memory.
+
+
+def downscale(im, max_width=None):
+    # Shrink to at most max_width pixels wide, keeping the aspect ratio
+    if max_width and im.width > max_width:
+        height = max(1, round(im.height * max_width / im.width))
+        im = im.resize((max_width, height), resample=Image.Resampling.LANCZOS)
+    return im
+
+
+def fit_frame(im, size):
+    # Every frame of an animation must share the first frame's canvas size
+    if im.size != size:
+        im = im.resize(size, resample=Image.Resampling.LANCZOS)
+    return im
+
+
+class GifStreamWriter:
+    # Writes the GIF header with the first frame, then appends each frame's image
+    # block straight to the file. With shared_palette the first frame's adaptive
+    # palette becomes the global palette for every frame; otherwise each frame
+    # carries its own local palette (like PIL's save_all).
+    def __init__(self, path, duration=600, loop=0, shared_palette=False, colors=256, max_width=None):
+        self.path = path
+        self.duration = duration
+        self.loop = loop
+        self.shared_palette = shared_palette
+        self.colors = colors
+        self.max_width = max_width
+        self.size = None
+        self.palette_image = None
+        self.frames = 0
+        self.fp = open(path, 'wb')
+
+    def add(self, frame):
+        frame = downscale(frame.convert('RGB'), self.max_width)
+        if self.size is None:
+            self.size = frame.size
+        frame = fit_frame(frame, self.size)
+
+        if self.palette_image is not None:
+            indexed = frame.quantize(palette=self.palette_image)
+        else:
+            indexed = frame.quantize(colors=self.colors)
+
+        if self.frames == 0:
+            header, _ = GifImagePlugin.getheader(indexed, info={'loop': self.loop, 'duration': self.duration,
+                                                               'optimize': False})
+            for block in header:
+                self.fp.write(block)
+            if self.shared_palette:
+                self.palette_image = indexed
+        include_color_table = not self.shared_palette and self.frames > 0
+        for block in GifImagePlugin.getdata(indexed, duration=self.duration,
+                                            include_color_table=include_color_table):
+            self.fp.write(block)
+        self.frames += 1
+
+    def close(self):
+        if self.fp is not None:
+            if self.frames:
+                self.fp.write(b';')  # GIF trailer
+            self.fp.close()
+            self.fp = None
+            if not self.frames:
+                os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FfmpegStreamWriter:
+    # Pipes raw RGB frames into a local ffmpeg for MP4 (H.264) or WebM (VP9) output
+    CODECS = {'.mp4': ['-c:v', 'libx264'], '.webm': ['-c:v', 'libvpx-vp9', '-b:v', '0', '-crf', '32']}
+
+    def __init__(self, path, duration=600, max_width=None, ffmpeg=None):
+        self.path = path
+        self.fps = 1000.0 / duration
+        self.max_width = max_width
+        self.ffmpeg = ffmpeg or shutil.which('ffmpeg')
+        if self.ffmpeg is None:
+            raise RuntimeError("ffmpeg not found on PATH; write a .gif instead.")
+        self.size = None
+        self.proc = None
+        self.frames = 0
+
+    def _start(self, size):
+        ext = os.path.splitext(self.path)[1].lower()
+        cmd = [self.ffmpeg, '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{size[0]}x{size[1]}',
+               '-r', f'{self.fps:g}', '-i', '-',
+               '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2:color=white', '-pix_fmt', 'yuv420p']
+        cmd += self.CODECS.get(ext, []) + [self.path]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def add(self, frame):
+        frame = downscale(frame.convert('RGB'), self.max_width)
+        if self.size is None:
+            self.size = frame.size
+            self._start(self.size)
+        self.proc.stdin.write(fit_frame(frame, self.size).tobytes())
+        self.frames += 1
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdin.close()
+            if self.proc.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed writing {self.path}")
+            self.proc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_animation(path, duration=600, shared_palette=False, max_width=None):
+    # Pick the writer from the file extension (.gif, .mp4 or .webm)
+    if os.path.splitext(path)[1].lower() in FfmpegStreamWriter.CODECS:
+        return FfmpegStreamWriter(path, duration, max_width)
+    return GifStreamWriter(path, duration, shared_palette=shared_palette, max_width=max_width)
@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+import numpy as np
+from netCDF4 import Dataset
+
+# Benchmark harness for the read / reduce / render / composite stages, run on
+# synthetic NETCDF3_CLASSIC files laid out like the real Year_N/year_N_combined.nc
+# (XNEW/YNEW/TDAYS dimensions, un/vn/pn with 1e36 fills). Runs offline: the render
+# stage uses the plain daily frame, not cartopy's Natural Earth features.
+#
+#   python benchmarks/bench_pipeline.py --sizes 120x180 240x360 --output bench.jsonl
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+FILL_VALUE = 1e+36
+
+
+def write_fixture(path, ny, nx, nt=365, seed=0):
+    # Synthetic year file: smooth seasonal wind/pressure plus noise, static land mask
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with Dataset(path, 'w', format='NETCDF3_CLASSIC') as ds:
+        ds.createDimension('TDAYS', nt)
+        ds.createDimension('YNEW', ny)
+        ds.createDimension('XNEW', nx)
+        ds.createVariable('TDAYS', 'f8', ('TDAYS',))[:] = np.arange(nt)
+        lon = np.linspace(30.125, 119.875, nx)
+        lat = np.linspace(-29.875, 29.875, ny)
+        ds.createVariable('lon', 'f8', ('XNEW',))[:] = lon
+        ds.createVariable('lat', 'f8', ('YNEW',))[:] = lat
+
+        land = rng.random((ny, nx)) < 0.2
+        phase = 2 * np.pi * np.arange(nt) / 365.0
+        for name, amplitude in (('un', 500.0), ('vn', 500.0), ('pn', 5000.0)):
+            var = ds.createVariable(name, 'f4', ('TDAYS', 'YNEW', 'XNEW'), fill_value=np.float32(FILL_VALUE))
+            var.missing_value = np.float32(FILL_VALUE)
+            base = amplitude * np.sin(np.radians(lat))[:, None] * np.cos(np.radians(lon))[None, :]
+            for t in range(nt):
+                day = (base * np.cos(phase[t]) + rng.standard_normal((ny, nx)) * amplitude * 0.2)
+                day = day.astype(np.float32)
+                day[land] = FILL_VALUE
+                var[t] = day
+    return path
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Stages:
+    def __init__(self, size):
+        self.size = size
+        self.records = []
+
+    def run(self, name, func, units, unit_name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        result = func()
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        self.records.append({
+            'size': self.size, 'stage': name,
+            'wall_s': round(wall, 4), 'cpu_s': round(cpu, 4),
+            'throughput': round(units / wall, 2) if wall > 0 else None,
+            'throughput_unit': f'{unit_name}/s',
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        })
+        return result
+
+
+def bench_size(ny, nx, nt, workdir, frames):
+    import matplotlib
+    matplotlib.use('Agg')
+    from nc_region import BAY_OF_BENGAL, open_dataset, region_slices, read_region
+    from chunked_store import convert
+    from season_reducer import SEASON_DAYS, reduce_seasons
+    from window_means import monthly_windows, window_means
+    from map_frame import daily_frame
+
+    size = f'{ny}x{nx}'
+    path = os.path.join(workdir, f'Year_{size}', f'year_{size}_combined.nc')
+    if not os.path.exists(path):
+        write_fixture(path, ny, nx, nt)
+    stages = Stages(size)
+    nbytes = 3 * nt * ny * nx * 4
+
+    def read_full(backend='netcdf4'):
+        with open_dataset(path, backend) as ds:
+            return {name: read_region(ds.variables[name]) for name in ('un', 'vn', 'pn')}
+
+    def read_region_block(backend='netcdf4', source=path):
+        with open_dataset(source, backend) as ds:
+            lat_slice, lon_slice = region_slices(ds.variables['lat'][:], ds.variables['lon'][:], BAY_OF_BENGAL)
+            return {name: read_region(ds.variables[name], None, lat_slice, lon_slice)
+                    for name in ('un', 'vn')}
+
+    full = stages.run('read_full', read_full, nbytes / 1e6, 'MB')
+    region = stages.run('read_region', read_region_block, nbytes / 1e6, 'MB(file)')
+    stages.run('read_full_mmap', lambda: read_full('mmap'), nbytes / 1e6, 'MB')
+    stages.run('read_region_mmap', lambda: read_region_block('mmap'), nbytes / 1e6, 'MB(file)')
+    store = os.path.join(workdir, f'store_{size}.nc')
+    if os.path.exists(store):
+        os.remove(store)
+    stages.run('convert_store', lambda: convert([(1, path)], store), nbytes / 1e6, 'MB')
+    stages.run('read_region_store', lambda: read_region_block(source=(store, 1)), nbytes / 1e6, 'MB(file)')
+    stages.run('reduce_seasons', lambda: reduce_seasons(region['un'], region['vn'], SEASON_DAYS),
+               region['un'].size * 2 / 1e6, 'Mcell')
+    windows = [(a, b + 1) for a, b in monthly_windows(1, min(364, nt - 1))]
+    stages.run('reduce_windows', lambda: window_means({'U': full['un'], 'V': full['vn'], 'P': full['pn']}, windows),
+               full['un'].size * 3 / 1e6, 'Mcell')
+
+    with Dataset(path) as ds:
+        lon = ds.variables['lon'][:]
+        lat = ds.variables['lat'][:]
+    png_dir = os.path.join(workdir, f'frames_{size}')
+    os.makedirs(png_dir, exist_ok=True)
+
+    def render():
+        frame = None
+        for t in range(frames):
+            U = full['un'][t] / 10  # read_region already turned fills into NaN
+            V = full['vn'][t] / 10
+            P = full['pn'][t] / 980
+            if frame is None:
+                frame = daily_frame(lon, lat, P, U, V, f'day {t}')
+            else:
+                frame.update(P, U, V, f'day {t}')
+            frame.save(os.path.join(png_dir, f'Bench-{2011 + t}.png'), dpi=100)
+        frame.close()
+
+    stages.run('render', render, frames, 'frame')
+    from season_grid import make_season_grid
+    stages.run('composite', lambda: make_season_grid(png_dir, os.path.join(workdir, f'grid_{size}.png')),
+               frames, 'image')
+    stages.run('composite_serial',
+               lambda: make_season_grid(png_dir, os.path.join(workdir, f'grid_{size}.png'), workers=1),
+               frames, 'image')
+    stages.run('composite_processes',
+               lambda: make_season_grid(png_dir, os.path.join(workdir, f'grid_{size}.png'), processes=True),
+               frames, 'image')
+    stages.run('composite_webp', lambda: make_season_grid(png_dir, os.path.join(workdir, f'grid_{size}.webp')),
+               frames, 'image')
+    return stages.records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark read/reduce/render/composite on synthetic NetCDF files.')
+    parser.add_argument('--sizes', nargs='+', default=['60x90', '120x180', '240x360'],
+                        help='Grid sizes as LATxLON (default: 60x90 120x180 240x360)')
+    parser.add_argument('--days', type=int, default=365, help='Days per synthetic year (default: 365)')
+    parser.add_argument('--frames', type=int, default=12, help='Frames rendered and composited (default: 12)')
+    parser.add_argument('--workdir', default=None, help='Where fixtures are written (default: a temp dir)')
+    parser.add_argument('--output', default=None, help='Append JSONL records to this file')
+    parser.add_argument('--single', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ncpor_bench_')
+    if args.single:
+        # Child process: one size, so peak RSS is not inherited from other sizes
+        ny, nx = (int(n) for n in args.single.split('x'))
+        for record in bench_size(ny, nx, args.days, workdir, args.frames):
+            print(json.dumps(record))
+        return
+
+    records = []
+    for size in args.sizes:
+        cmd = [sys.executable, os.path.abspath(__file__), '--single', size, '--days', str(args.days),
+               '--frames', str(args.frames), '--workdir', workdir]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        records.extend(json.loads(line) for line in out.splitlines() if line.startswith('{'))
+
+    print(f"{'size':>10} {'stage':>15} {'wall s':>8} {'cpu s':>8} {'throughput':>20} {'peak MB':>8}")
+    for r in records:
+        throughput = f"{r['throughput']} {r['throughput_unit']}"
+        print(f"{r['size']:>10} {r['stage']:>15} {r['wall_s']:>8.3f} {r['cpu_s']:>8.3f} {throughput:>20} {r['peak_rss_mb']:>8.1f}")
+    if args.output:
+        with open(args.output, 'a') as f:
+            for r in records:
+                f.write(json.dumps(r) + '\n')
+        print(f"\nBenchmark records appended to: {args.output}")
+    print(f"Fixtures in: {workdir}")
+
+
+if __name__ == '__main__':
+    main()
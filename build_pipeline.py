@@ -0,0 +1,265 @@
+import os
+import sys
+import fnmatch
+import argparse
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from clim_cache import CACHE_DIR, ClimCache
+from multi_year_clim import find_year_files
+from nc_region import BACKEND_HELP, BACKENDS
+from season_reducer import SEASON_DAYS
+import season_grid
+
+# Make-style build runner for the figure pipeline:
+#
+#   Year_N/year_N_combined.nc -> Image_output/{Season}/{Season}-20NN.png   (plot_vector_scalar.py)
+#   {folder}/{Season}/*.png    -> {folder}/{Season}.png                     (season_grid.py)
+#   both season folders        -> Comparison/{season}_Comparison_*.png      (comparison-LCS-Sat.py)
+#   both folders               -> seasonal_comparison.gif                   (left-right-comparison-gif.py)
+#
+# A target is rebuilt only when one of its outputs is missing, one of its inputs
+# is newer than its oldest output, or a target it depends on is being rebuilt.
+# Independent targets run concurrently on a process pool as their inputs become ready.
+#
+#   python build_pipeline.py --workers 4             # everything that is stale
+#   python build_pipeline.py 'grid:*' --dry-run      # what the season grids would rebuild
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+GRID_FOLDERS = ('Image_output', 'LCS-seasons-images')
+# The code that draws the season plots: editing any of it restyles them
+PLOT_SOURCES = tuple(os.path.join(REPO, name) for name in
+                     ('plot_vector_scalar.py', 'season_products.py', 'map_frame.py', 'derived_fields.py'))
+
+
+def load_script(name):
+    # The pipeline scripts with hyphens in their names are not importable by module name
+    path = os.path.join(REPO, name)
+    module_name = os.path.splitext(name)[0].replace('-', '_').replace(os.sep, '_')
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def full_year(n):
+    # Same naming as plot_vector_scalar.py: Year_6 -> 2006, Year_12 -> 2012
+    year = str(n)
+    return ('200' if len(year) == 1 else '20') + year
+
+
+class Target:
+    def __init__(self, name, outputs, inputs, recipe, args=()):
+        self.name = name
+        self.outputs = list(outputs)
+        self.inputs = list(inputs)
+        self.recipe = recipe  # module-level function, so it pickles to the workers
+        self.args = tuple(args)
+        self.deps = set()
+
+
+# Recipes (run in the worker processes, with the repository root as cwd)
+
+def build_season_plots(year, cache, backend='netcdf4'):
+    import plot_vector_scalar
+    plot_vector_scalar.generate_season_wise_plots_updated(str(year), cache, backend)
+
+
+def build_season_grid(folder, season):
+    season_grid.make_season_grid(os.path.join(folder, season), os.path.join(folder, f'{season}.png'))
+
+
+def build_comparison(season, year_init, year_final):
+    os.makedirs('Comparison', exist_ok=True)
+    load_script('comparison-LCS-Sat.py').combine_season_grid(season, year_init, year_final)
+
+
+def build_animation(output, max_width, shared_palette):
+    load_script('left-right-comparison-gif.py').write_comparison_animation(output, max_width, shared_palette)
+
+
+# Graph
+
+def folder_listing(folder, planned):
+    # File names in `folder` now, plus the ones earlier targets will write there
+    names = set(os.listdir(folder)) if os.path.isdir(folder) else set()
+    names.update(os.path.basename(path) for path in planned
+                 if os.path.dirname(path) == folder)
+    return sorted(names)
+
+
+def build_graph(root='.', cache=None, animation='seasonal_comparison.gif', max_width=None,
+                shared_palette=False, backend='netcdf4'):
+    targets = []
+
+    for n, path in find_year_files(root):
+        year_full = full_year(n)
+        outputs = [os.path.join('Image_output', season, f'{season}-{year_full}.png') for season in SEASON_DAYS]
+        targets.append(Target(f'plots:{n}', outputs, [path, *PLOT_SOURCES], build_season_plots,
+                              (n, cache, backend)))
+    planned = [path for target in targets for path in target.outputs]
+
+    # Season grids take the first rows*cols images of their folder in sorted order,
+    # so a new year that sorts after them leaves the grid untouched.
+    for folder in GRID_FOLDERS:
+        for season in season_grid.seasons:
+            season_dir = os.path.join(folder, season)
+            names = [name for name in folder_listing(season_dir, planned)
+                     if name.lower().endswith(season_grid.exts)]
+            if not names:
+                continue
+            inputs = [os.path.join(season_dir, name) for name in names[:season_grid.rows * season_grid.cols]]
+            targets.append(Target(f'grid:{folder}:{season}', [os.path.join(folder, f'{season}.png')],
+                                  inputs + [season_grid.__file__], build_season_grid, (folder, season)))
+
+    comparison = load_script('comparison-LCS-Sat.py')
+    for season in comparison.seasons:
+        for year_init, year_final in comparison.years_ranges:
+            inputs = comparison.comparison_inputs(season, year_init, year_final)
+            targets.append(Target(f'comparison:{season}:{year_init}-{year_final}',
+                                  [comparison.comparison_output(season, year_init, year_final)],
+                                  inputs + [comparison.__file__], build_comparison,
+                                  (season, year_init, year_final)))
+
+    gif = load_script('left-right-comparison-gif.py')
+    frames = {}
+    for folder in (gif.folder_x, gif.folder_y):
+        frames[folder] = {name for name in folder_listing(folder, planned) if gif.pattern.match(name)}
+    names = frames[gif.folder_x] & frames[gif.folder_y]
+    if names:
+        inputs = [os.path.join(folder, name) for name in sorted(names) for folder in (gif.folder_x, gif.folder_y)]
+        targets.append(Target('animation', [animation], inputs + [gif.__file__], build_animation,
+                              (animation, max_width, shared_palette)))
+
+    # Wire dependencies: a target depends on whichever targets write its inputs
+    producers = {os.path.normpath(path): target for target in targets for path in target.outputs}
+    for target in targets:
+        for path in target.inputs:
+            producer = producers.get(os.path.normpath(path))
+            if producer is not None and producer is not target:
+                target.deps.add(producer.name)
+    return {target.name: target for target in targets}
+
+
+def select(graph, patterns):
+    # Targets matching any pattern, plus everything they depend on
+    if not patterns:
+        return set(graph)
+    wanted = [name for name in graph if any(fnmatch.fnmatch(name, p) for p in patterns)]
+    if not wanted:
+        raise SystemExit(f"No targets match: {' '.join(patterns)}")
+    selected = set()
+    stack = list(wanted)
+    while stack:
+        name = stack.pop()
+        if name not in selected:
+            selected.add(name)
+            stack.extend(graph[name].deps)
+    return selected
+
+
+def is_stale(target):
+    if not all(os.path.exists(path) for path in target.outputs):
+        return True
+    oldest_output = min(os.stat(path).st_mtime_ns for path in target.outputs)
+    # Inputs that do not exist and nothing produces (e.g. a missing LCS year) don't count
+    newest_input = max((os.stat(path).st_mtime_ns for path in target.inputs if os.path.exists(path)), default=0)
+    return newest_input > oldest_output
+
+
+def stale_targets(graph, selected, force=False):
+    stale = set()
+    remaining = set(selected)
+    while remaining:
+        # Resolve in dependency order so a rebuilt producer marks its consumers stale
+        ready = [name for name in remaining if not (graph[name].deps & remaining)]
+        if not ready:
+            raise SystemExit(f"Dependency cycle among: {' '.join(sorted(remaining))}")
+        for name in sorted(ready):
+            target = graph[name]
+            if force or target.deps & stale or is_stale(target):
+                stale.add(name)
+            remaining.discard(name)
+    return stale
+
+
+def run_target(target):
+    target.recipe(*target.args)
+    return target.name
+
+
+def run(graph, todo, workers=1):
+    # Submit each stale target as soon as the targets it depends on have finished
+    done, failed = set(), set()
+    pending = {}
+    waiting = set(todo)
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        while waiting or pending:
+            for name in sorted(waiting):
+                deps = graph[name].deps & todo
+                if deps & failed:
+                    print(f"Skipping {name}: a prerequisite failed")
+                    waiting.discard(name)
+                    failed.add(name)
+                elif deps <= done:
+                    print(f"Building {name}")
+                    pending[executor.submit(run_target, graph[name])] = name
+                    waiting.discard(name)
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = pending.pop(future)
+                try:
+                    future.result()
+                    done.add(name)
+                    print(f"Built {name}")
+                except Exception as exc:
+                    failed.add(name)
+                    print(f"Failed {name}: {exc!r}")
+    return done, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild stale figures of the seasonal pipeline.')
+    parser.add_argument('targets', nargs='*',
+                        help="Target name patterns, e.g. 'plots:12' 'grid:*' 'comparison:Summer:*' animation (default: all)")
+    parser.add_argument('--root', default='.', help='Directory holding Year_N/ and the image folders (default: .)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Targets built concurrently (default: number of CPUs)')
+    parser.add_argument('--dry-run', action='store_true', help='List the stale targets without building them')
+    parser.add_argument('--force', action='store_true', help='Rebuild the selected targets even if up to date')
+    parser.add_argument('--animation', default='seasonal_comparison.gif',
+                        help='Animation output (.gif, .mp4 or .webm; default: seasonal_comparison.gif)')
+    parser.add_argument('--max-width', type=int, default=None, help='Downscale animation frames to this width')
+    parser.add_argument('--shared-palette', action='store_true', help='One GIF palette for all frames')
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help=f'Season-mean cache directory (default: {CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the season-mean cache')
+    parser.add_argument('--backend', choices=BACKENDS, default='netcdf4',
+                        help=BACKEND_HELP)
+    args = parser.parse_args()
+
+    # Every script writes relative to the repository layout
+    os.chdir(args.root)
+    cache = None if args.no_cache else ClimCache(args.cache_dir)
+    graph = build_graph('.', cache, args.animation, args.max_width, args.shared_palette, args.backend)
+    selected = select(graph, args.targets)
+    todo = stale_targets(graph, selected, args.force)
+
+    print(f"{len(todo)} of {len(selected)} targets out of date")
+    if args.dry_run or not todo:
+        for name in sorted(todo):
+            print(f"  {name}")
+        return
+
+    done, failed = run(graph, todo, args.workers)
+    print(f"Built {len(done)} targets, {len(failed)} failed")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
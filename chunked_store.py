@@ -0,0 +1,245 @@
+import os
+import time
+import argparse
+import numpy as np
+from netCDF4 import Dataset
+from fill_values import read_nan, to_masked
+from nc_region import BACKEND_HELP, BACKENDS, BAY_OF_BENGAL, open_dataset, region_slices
+
+# Multi-year store: every Year_N/year_N_combined.nc rewritten into one chunked,
+# compressed netCDF4 file with dimensions (year, day, lat, lon). The contiguous
+# classic files are laid out for whole maps; with chunks of a month by a few degrees
+# a daily map, a Bay of Bengal box or a single point's multi-year time series only
+# decompresses the chunks it touches.
+#
+#   python chunked_store.py --root . --output years_store.nc            # convert / append new years
+#   python plot_vector_scalar.py 11 12 --store years_store.nc           # read from it
+#
+# StoreYear is a Dataset look-alike for one year, so the plotting scripts read from
+# the store through the same read_region/window_means code as from a Year_N file.
+# Each year carries the time it was written (`stamp`), which the caches key on, so
+# appending a year leaves the cached results of the others valid.
+
+STORE_PATH = 'years_store.nc'
+VARIABLES = ('un', 'vn', 'pn')
+CHUNKS = (32, 40, 40)  # (day, lat, lon) per chunk, one year deep; ~200 KB uncompressed
+MAX_DAYS = 366
+FILL_VALUE = np.float32(9.969e+36)
+CHUNK_CACHE_BYTES = 64 * 1024**2  # per variable; holds a month of full-grid chunks
+
+
+def create_store(output, lat, lon, variables=VARIABLES, chunks=CHUNKS, complevel=4, max_days=MAX_DAYS):
+    ds = Dataset(output, 'w', format='NETCDF4')
+    ds.createDimension('year', None)
+    ds.createDimension('day', max_days)
+    ds.createDimension('lat', len(lat))
+    ds.createDimension('lon', len(lon))
+    ds.createVariable('year', 'i4', ('year',))
+    ds.createVariable('n_days', 'i4', ('year',))
+    ds.createVariable('stamp', 'i8', ('year',))
+    ds.createVariable('lat', 'f8', ('lat',))[:] = lat
+    ds.createVariable('lon', 'f8', ('lon',))[:] = lon
+    chunksizes = (1, min(chunks[0], max_days), min(chunks[1], len(lat)), min(chunks[2], len(lon)))
+    for name in variables:
+        ds.createVariable(name, 'f4', ('year', 'day', 'lat', 'lon'), zlib=True, complevel=complevel,
+                          shuffle=True, chunksizes=chunksizes, fill_value=FILL_VALUE)
+    ds.chunks = ' '.join(str(c) for c in chunksizes)
+    return ds
+
+
+def convert(files, output=STORE_PATH, variables=VARIABLES, chunks=CHUNKS, complevel=4,
+            backend='netcdf4', day_chunk=None):
+    # Append every (N, path) year file not already in the store (creating it if needed)
+    if not files:
+        raise ValueError("No year files to convert.")
+    with open_dataset(files[0][1], backend) as src:
+        lat = np.asarray(src.variables['lat'][:])
+        lon = np.asarray(src.variables['lon'][:])
+    if os.path.exists(output):
+        store = Dataset(output, 'a')
+        if not (np.array_equal(store.variables['lat'][:], lat) and np.array_equal(store.variables['lon'][:], lon)):
+            store.close()
+            raise ValueError(f"{output} holds a different grid than {files[0][1]}.")
+    else:
+        store = create_store(output, lat, lon, variables, chunks, complevel)
+
+    with store:
+        present = set(int(year) for year in store.variables['year'][:])
+        if 'stamp' not in store.variables:
+            # Store written before per-year stamps: stamp the years it holds now
+            store.createVariable('stamp', 'i8', ('year',))[:] = np.full(len(present), time.time_ns())
+        day_chunk = day_chunk or store.variables[variables[0]].chunking()[1]
+        for year, path in files:
+            if year in present:
+                continue
+            k = len(store.dimensions['year'])
+            with open_dataset(path, backend) as src:
+                n_days = src.variables[variables[0]].shape[0]
+                if n_days > len(store.dimensions['day']):
+                    raise ValueError(f"{path} has {n_days} days; the store holds at most "
+                                     f"{len(store.dimensions['day'])}.")
+                store.variables['year'][k] = year
+                store.variables['n_days'][k] = n_days
+                store.variables['stamp'][k] = time.time_ns()
+                # Copy in chunk-aligned day blocks; missing cells go in as _FillValue
+                for name in variables:
+                    for start in range(0, n_days, day_chunk):
+                        stop = min(start + day_chunk, n_days)
+                        store.variables[name][k, start:stop] = to_masked(read_nan(src.variables[name],
+                                                                                  slice(start, stop)))
+            print(f"Stored Year {year} ({path}) -> {output}[year={k}]")
+    return output
+
+
+# {(store path, mtime, size): {year: stamp}}, read once per version of the store
+_stamps = {}
+
+
+def year_stamp(path, year):
+    # Identity of one year's data in a store: the store path, the year and the time it
+    # was written. Stores without stamps fall back to the whole file's mtime and size.
+    st = os.stat(path)
+    version = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if version not in _stamps:
+        with Dataset(path) as ds:
+            years = [int(y) for y in ds.variables['year'][:]]
+            if 'stamp' in ds.variables:
+                _stamps[version] = dict(zip(years, (int(t) for t in ds.variables['stamp'][:])))
+            else:
+                _stamps[version] = {y: f'{st.st_mtime_ns}:{st.st_size}' for y in years}
+    return f"{version[0]}:{int(year)}:{_stamps[version].get(int(year))}"
+
+
+class StoreVariable:
+    # One year of a (year, day, lat, lon) store variable, indexed like a (time, lat, lon) one
+    def __init__(self, var, index, n_days):
+        self.var = var
+        self.index = index
+        self.n_days = n_days
+
+    @property
+    def shape(self):
+        return (self.n_days,) + self.var.shape[2:]
+
+    @property
+    def dtype(self):
+        return self.var.dtype
+
+    @property
+    def mask(self):
+        return self.var.mask
+
+    def set_auto_mask(self, value):
+        self.var.set_auto_mask(value)
+
+    def ncattrs(self):
+        return self.var.ncattrs()
+
+    def __getattr__(self, name):
+        # netCDF attributes (_FillValue, units, ...) come from the store variable
+        if name == 'var':
+            raise AttributeError(name)
+        return getattr(self.var, name)
+
+    def __len__(self):
+        return self.n_days
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        day, rest = (key[0], key[1:]) if key else (slice(None), ())
+        if isinstance(day, slice):
+            day = slice(*day.indices(self.n_days))
+        elif isinstance(day, (int, np.integer)):
+            day = int(day) + (self.n_days if day < 0 else 0)
+            if not 0 <= day < self.n_days:
+                raise IndexError(f"Day {key[0]} out of range for a {self.n_days}-day year.")
+        else:
+            day = np.asarray(day)
+            day = np.where(day < 0, day + self.n_days, day)
+            if day.size and (day.min() < 0 or day.max() >= self.n_days):
+                raise IndexError(f"Days out of range for a {self.n_days}-day year.")
+        return self.var[(self.index, day) + rest]
+
+
+class StoreYear:
+    # Dataset look-alike for one year: variables lon, lat and the (day, lat, lon) fields
+    def __init__(self, store, year):
+        self.store = store
+        self.year = year
+        years = [int(y) for y in store.ds.variables['year'][:]]
+        if year not in years:
+            raise KeyError(f"Year {year} is not in {store.path}.")
+        index = years.index(year)
+        n_days = int(store.ds.variables['n_days'][index])
+        self.variables = {'lon': store.ds.variables['lon'], 'lat': store.ds.variables['lat']}
+        for name in store.variables:
+            self.variables[name] = StoreVariable(store.ds.variables[name], index, n_days)
+
+    def close(self):
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ChunkedStore:
+    def __init__(self, path=STORE_PATH, chunk_cache=CHUNK_CACHE_BYTES):
+        self.path = path
+        self.ds = Dataset(path)
+        self.variables = [name for name, var in self.ds.variables.items()
+                          if var.dimensions == ('year', 'day', 'lat', 'lon')]
+        for name in self.variables:
+            self.ds.variables[name].set_var_chunk_cache(size=chunk_cache)
+
+    @property
+    def years(self):
+        return [int(year) for year in self.ds.variables['year'][:]]
+
+    def year(self, year):
+        return StoreYear(self, int(year))
+
+    def region(self, variable, region=BAY_OF_BENGAL, years=None, days=slice(None)):
+        # NaN-filled (year, day, lat, lon) block of a region over many years in one read;
+        # only the chunks overlapping the box are decompressed
+        lat_slice, lon_slice = region_slices(self.ds.variables['lat'][:], self.ds.variables['lon'][:], region)
+        index = slice(None) if years is None else [self.years.index(int(y)) for y in years]
+        return read_nan(self.ds.variables[variable], (index, days, lat_slice, lon_slice))
+
+    def close(self):
+        if self.ds.isopen():
+            self.ds.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def store_years(path=STORE_PATH):
+    # (N, (store, N)) for every year in the store, like multi_year_clim.find_year_files
+    with ChunkedStore(path) as store:
+        return [(year, (path, year)) for year in sorted(store.years)]
+
+
+if __name__ == '__main__':
+    from multi_year_clim import find_year_files
+
+    parser = argparse.ArgumentParser(description='Convert Year_N NetCDF files into one chunked, compressed store.')
+    parser.add_argument('--root', default='.', help='Directory containing the Year_N folders')
+    parser.add_argument('--output', default=STORE_PATH, help=f'Store file (default: {STORE_PATH})')
+    parser.add_argument('--years', type=int, nargs='*', default=None, help='Only these year numbers')
+    parser.add_argument('--chunks', type=int, nargs=3, default=list(CHUNKS), metavar=('DAY', 'LAT', 'LON'),
+                        help=f'Chunk shape of a new store (default: {" ".join(map(str, CHUNKS))})')
+    parser.add_argument('--complevel', type=int, default=4, help='zlib level of a new store (default: 4)')
+    parser.add_argument('--backend', choices=BACKENDS, default='netcdf4',
+                        help=BACKEND_HELP)
+    args = parser.parse_args()
+
+    files = find_year_files(args.root)
+    if args.years is not None:
+        files = [(year, path) for year, path in files if year in args.years]
+    convert(files, args.output, VARIABLES, tuple(args.chunks), args.complevel, args.backend)
@@ -0,0 +1,113 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# Reduced 2D fields (season / window means) are cached here as compressed .npz files
+CACHE_DIR = '.clim_cache'
+MAX_BYTES = 2 * 1024**3  # evict least recently used entries beyond 2 GB
+
+_MASK_SUFFIX = '__mask'
+# Bumped when the cached field format changes (2: NaN-filled float32 instead of masked
+# arrays, 3: derived products stored with the means)
+CACHE_VERSION = 3
+
+
+class ClimCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, source, variable, region=None, days=None, **extra):
+        # The key includes the source file's mtime and size so a rewritten
+        # Year_N file never serves stale means; old entries just age out.
+        # `source` may also be (store, N), one year of a multi-year store, which is
+        # keyed on that year's own stamp so appending years keeps the others cached.
+        source, member = source if isinstance(source, tuple) else (source, None)
+        parts = {
+            'source': os.path.abspath(source),
+            'variable': variable,
+            'region': region,
+            'days': None if days is None else [int(d) for d in days],
+            'extra': extra,
+            'version': CACHE_VERSION,
+        }
+        if member is None:
+            st = os.stat(source)
+            parts['mtime_ns'] = st.st_mtime_ns
+            parts['size'] = st.st_size
+        else:
+            from chunked_store import year_stamp
+            parts['member'] = member
+            parts['stamp'] = year_stamp(source, member)
+        blob = json.dumps(parts, sort_keys=True).encode()
+        return hashlib.sha1(blob).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npz')
+
+    def load(self, key):
+        # Return the cached {name: array} dict or None on a miss
+        path = self._path(key)
+        try:
+            with np.load(path) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            pass  # evicted by another worker since it was read; the arrays are still good
+        fields = {}
+        for name, value in arrays.items():
+            if name.endswith(_MASK_SUFFIX):
+                continue
+            mask = arrays.get(name + _MASK_SUFFIX)
+            fields[name] = np.ma.MaskedArray(value, mask=mask) if mask is not None else value
+        return fields
+
+    def store(self, key, fields):
+        # Save a {name: array} dict; masked arrays keep their masks
+        os.makedirs(self.cache_dir, exist_ok=True)
+        arrays = {}
+        for name, value in fields.items():
+            if np.ma.isMaskedArray(value):
+                arrays[name] = np.ma.getdata(value)
+                arrays[name + _MASK_SUFFIX] = np.ma.getmaskarray(value)
+            else:
+                arrays[name] = np.asarray(value)
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        # Drop least recently used entries until the cache fits in max_bytes
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                try:
+                    st = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue  # evicted by another process since the listdir
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def cached(self, compute, source, variable, region=None, days=None, **extra):
+        # Load the fields for this key, or compute and store them on a miss
+        key = self.key(source, variable, region, days, **extra)
+        fields = self.load(key)
+        if fields is None:
+            fields = compute()
+            self.store(key, fields)
+        return fields
@@ -0,0 +1,88 @@
+import numpy as np
+from fill_values import valid_values
+
+
+def percentile(values, q):
+    # Same result as np.percentile(values, q) (linear interpolation), but every
+    # requested percentile comes out of a single np.partition instead of a full sort.
+    values = np.asarray(values).ravel()
+    n = values.size
+    if n == 0:
+        raise ValueError("Cannot take a percentile of an empty array.")
+    # As in numpy, a Python scalar q interpolates in the data's precision (float32 stays
+    # float32) and a sequence of q in float64
+    weak_q = type(q) in (int, float)
+    positions = (n - 1) * np.true_divide(q, 100)
+    below_idx = np.floor(positions).astype(np.intp)
+    above_idx = np.minimum(below_idx + 1, n - 1)
+    part = np.partition(values, np.unique(np.r_[np.ravel(below_idx), np.ravel(above_idx)]))
+    below = part[below_idx]
+    above = part[above_idx]
+    frac = positions - below_idx
+    if weak_q:
+        frac = float(frac)
+    # np.percentile's _lerp: interpolate from whichever neighbour is closer
+    diff = above - below
+    result = np.where(frac >= 0.5, above - diff * (1 - frac), below + diff * frac)
+    return result[()]
+
+
+class RunningQuantiles:
+    # Approximate quantiles of everything seen so far, kept as a fixed-size
+    # histogram that widens its range when new values fall outside it.
+    def __init__(self, quantiles=(1, 99), bins=4096):
+        self.quantiles = np.asarray(quantiles, dtype=np.float64)
+        self.bins = bins
+        self.edges = None
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    def _rebin(self, lo, hi):
+        new_edges = np.linspace(lo, hi, self.bins + 1)
+        if self.edges is not None:
+            centers = 0.5 * (self.edges[:-1] + self.edges[1:])
+            self.counts = np.histogram(centers, new_edges, weights=self.counts)[0].astype(np.int64)
+        self.edges = new_edges
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return self
+        vmin, vmax = values.min(), values.max()
+        if self.edges is None:
+            if vmin == vmax:
+                vmin, vmax = vmin - 0.5, vmax + 0.5
+            self._rebin(vmin, vmax)
+        elif vmin < self.edges[0] or vmax > self.edges[-1]:
+            # Grow by at least 2x so repeated small overshoots don't rebin every day
+            lo, hi = self.edges[0], self.edges[-1]
+            width = hi - lo
+            self._rebin(min(vmin, lo - 0.5 * width if vmin < lo else lo),
+                        max(vmax, hi + 0.5 * width if vmax > hi else hi))
+        self.counts += np.histogram(values, self.edges)[0]
+        return self
+
+    def bounds(self):
+        total = self.counts.sum()
+        if total == 0:
+            raise ValueError("No values seen yet.")
+        cum = np.cumsum(self.counts)
+        targets = self.quantiles / 100 * total
+        idx = np.minimum(np.searchsorted(cum, targets), self.bins - 1)
+        prev = np.where(idx > 0, cum[idx - 1], 0)
+        frac = np.clip((targets - prev) / np.maximum(self.counts[idx], 1), 0, 1)
+        width = self.edges[1] - self.edges[0]
+        return tuple(self.edges[idx] + frac * width)
+
+
+# Blank (NaN) values outside the lo and hi percentiles (1 and 99 by default) of the
+# non-missing values. Pass a RunningQuantiles to clip against quantiles accumulated
+# across days instead, or the (low, high) bounds to clip at.
+def mask_percentile(arr, lo=1, hi=99, running=None, bounds=None):
+    if bounds is not None:
+        low, high = bounds
+    elif running is not None:
+        low, high = running.update(valid_values(arr)).bounds()
+    else:
+        low, high = percentile(valid_values(arr), [lo, hi])
+    return np.where((arr < low) | (arr > high), np.nan, arr)
@@ -0,0 +1,48 @@
+import numpy as np
+
+# Derived products of a reduced (lat, lon) U/V field (a season or window mean), computed
+# once when the field is reduced and cached next to it, so every plot mode draws from
+# the same arrays instead of redoing the arithmetic per figure:
+#
+#   speed               sqrt(U^2 + V^2)
+#   magnitude           speed signed positive where U and V share a sign (the seasonal plots' colour field)
+#   direction           degrees counter-clockwise from east the wind blows towards, in (-180, 180]
+#   quiver_U, quiver_V  U and V decimated to every `step`-th cell, as drawn by the arrows
+#
+# The arrows keep the dtype of the fields they were cut from; the rest is float64, like
+# the numpy.ma arithmetic the plots used, so colours, percentiles and arrows are
+# unchanged. NaN stays NaN.
+
+QUIVER_STEP = 8
+PRODUCTS = ('speed', 'magnitude', 'direction', 'quiver_U', 'quiver_V')
+
+
+def signed_magnitude(U, V, speed=None):
+    # Positive where U and V share a sign, negative otherwise
+    U = U.astype(np.float64)
+    V = V.astype(np.float64)
+    if speed is None:
+        speed = np.sqrt(U**2 + V**2)
+    return speed * np.sign(U) * np.sign(V)
+
+
+def derive(U, V, scale=1, step=QUIVER_STEP):
+    # Products of U / scale and V / scale, scaled in the fields' own dtype (pass float64
+    # fields to scale float32 means in full precision)
+    U = U / scale
+    V = V / scale
+    U64 = U.astype(np.float64)
+    V64 = V.astype(np.float64)
+    speed = np.sqrt(U64**2 + V64**2)
+    return {
+        'speed': speed,
+        'magnitude': signed_magnitude(U64, V64, speed),
+        'direction': np.degrees(np.arctan2(V64, U64)),
+        'quiver_U': U[::step, ::step],
+        'quiver_V': V[::step, ::step],
+    }
+
+
+def quiver_grid(lon, lat, step=QUIVER_STEP):
+    # Arrow positions matching quiver_U / quiver_V: the decimated lon/lat meshgrid
+    return np.meshgrid(np.asarray(lon)[::step], np.asarray(lat)[::step])
@@ -0,0 +1,79 @@
+import numpy as np
+
+# Fill-value handling for the numeric core. Ferret writes missing cells as 9.969e+36;
+# they are turned into NaN once, when a block is read, and everything downstream
+# works on plain float32 ndarrays (NaN = missing) instead of numpy.ma masked arrays.
+# Matplotlib treats NaN exactly like a masked cell, so plots are unchanged.
+
+# Values at or above this are Ferret fill values (9.969e+36) and treated as missing
+FILL_THRESHOLD = 1e+30
+
+
+def declared_fills(var):
+    # _FillValue / missing_value attributes below the threshold (e.g. -999), which the
+    # >= FILL_THRESHOLD test alone would not catch
+    fills = []
+    for attr in ('_FillValue', 'missing_value'):
+        if hasattr(var, attr):
+            for value in np.atleast_1d(getattr(var, attr)):
+                if np.isfinite(value) and value < FILL_THRESHOLD:
+                    fills.append(value)
+    return fills
+
+
+def to_nan(block, fills=(), copy=True):
+    # float32 ndarray with NaN wherever `block` is masked, a Ferret fill or one of `fills`.
+    # copy=False converts in place where it can; copy=None copies only when there are
+    # cells to blank, so views of data owned elsewhere are never written to.
+    mask = np.ma.getmask(block)
+    source = np.ma.getdata(block)
+    data = np.array(source, dtype=np.float32) if copy else np.asarray(source, dtype=np.float32)
+    missing = data >= FILL_THRESHOLD
+    for value in fills:
+        missing |= data == value
+    if mask is not np.ma.nomask:
+        missing |= mask
+    if copy is None and np.may_share_memory(data, source):
+        if not missing.any():
+            return data
+        data = data.copy()
+    data[missing] = np.nan
+    return data
+
+
+def read_nan(var, key=slice(None)):
+    # Read var[key] as a NaN-filled float32 ndarray. netCDF4 variables are read with
+    # auto-masking off, so no masked array (and no parallel mask) is ever built.
+    # Other variables (nc3_mmap's big-endian views, in-memory arrays) may hand back
+    # views of data owned elsewhere: they are copied only when a cell needs blanking.
+    if not hasattr(var, 'set_auto_mask'):
+        return to_nan(var[key], declared_fills(var), copy=None)
+    auto_mask = getattr(var, 'mask', True)
+    var.set_auto_mask(False)
+    try:
+        block = var[key]
+    finally:
+        var.set_auto_mask(auto_mask)
+    return to_nan(block, declared_fills(var), copy=False)  # freshly read, converted in place
+
+
+def split_valid(block):
+    # Zero-filled data plus a 0/1 validity array of a NaN-filled block, for count-weighted sums
+    valid = ~np.isnan(block)
+    return np.where(valid, block, 0), valid.astype(np.int32)
+
+
+def nan_mean(sums, counts, scale=1):
+    # Count-weighted mean as float32, NaN where nothing was valid
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts / scale, np.nan).astype(np.float32)
+
+
+def valid_values(arr):
+    # The non-missing values of an array, flattened (np.ma's .compressed())
+    return arr[~np.isnan(arr)]
+
+
+def to_masked(arr):
+    # Masked view for writers that rely on the mask (netCDF4 writes masked cells as _FillValue)
+    return np.ma.masked_invalid(arr, copy=False)
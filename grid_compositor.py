@@ -0,0 +1,151 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from PIL import Image
+from image_store import ImageStore, default_store, image_size
+from stage_timer import timer
+
+# Grid composition shared by season_grid.py and monthly-combiner-initial-years.py: rows x cols images, row-major, on one canvas.
+#
+# The canvas is a preallocated (height, width, 3) uint8 array and each tile is
+# decoded, resized (through the image store's thumbnails) and copied into its slot by
+# a pool worker. Tiles are independent, so only the final encode is serial. Threads
+# are the default: PIL releases the GIL while decoding and resampling. With
+# processes=True the canvas lives in shared memory and the workers write into it
+# directly, so no pixels are pickled back.
+#
+# The output format follows the file extension: PNG (compress_level 0-9, default
+# zlib's) or WebP (lossless unless a quality is given).
+#
+#   compose_grid(paths, 'Winter.png', rows=3, cols=4, workers=8)
+#   compose_grid(paths, 'Winter.webp', rows=3, cols=4, webp_quality=90)
+
+
+def grid_layout(n_images, rows, cols, cell_size):
+    # (y, x) pixel offsets of the first rows*cols images, row-major
+    width, height = cell_size
+    return [((k // cols) * height, (k % cols) * width) for k in range(min(n_images, rows * cols))]
+
+
+def _load_tile(store, path, cell_size):
+    # The image at the cell size as an RGB uint8 array
+    return np.asarray(store.get(path, cell_size))
+
+
+def _paste(canvas, store, path, cell_size, offset):
+    y, x = offset
+    width, height = cell_size
+    canvas[y:y + height, x:x + width] = _load_tile(store, path, cell_size)
+
+
+# Process pool workers attach to the shared canvas once, in the initializer
+_shared = {}
+
+
+def _attach(name, shape, thumb_dir, exact):
+    shm = shared_memory.SharedMemory(name=name)
+    _shared['shm'] = shm
+    _shared['canvas'] = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    _shared['store'] = ImageStore(thumb_dir, exact)
+
+
+def _paste_shared(path, cell_size, offset):
+    _paste(_shared['canvas'], _shared['store'], path, cell_size, offset)
+
+
+def _fill(canvas, paths, cell_size, offsets, store, workers):
+    if workers <= 1:
+        for path, offset in zip(paths, offsets):
+            _paste(canvas, store, path, cell_size, offset)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() re-raises the first worker exception here
+        list(executor.map(lambda job: _paste(canvas, store, job[0], cell_size, job[1]), zip(paths, offsets)))
+
+
+def _fill_shared(shape, background, paths, cell_size, offsets, store, workers):
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+    try:
+        canvas = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        canvas[:] = background
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                 initargs=(shm.name, shape, store.thumb_dir, store.exact)) as executor:
+            list(executor.map(_paste_shared, paths, [cell_size] * len(paths), offsets))
+        return canvas.copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def save_image(im, output, compress_level=None, webp_quality=None):
+    # PNG or WebP by extension; other formats are passed to PIL as they are
+    ext = os.path.splitext(output)[1].lower()
+    if ext == '.webp':
+        if webp_quality is None:
+            im.save(output, format='WEBP', lossless=True)
+        else:
+            im.save(output, format='WEBP', quality=webp_quality)
+    elif ext == '.png' and compress_level is not None:
+        im.save(output, compress_level=compress_level)
+    else:
+        im.save(output)
+
+
+def compose_grid(paths, output, rows, cols, cell_size=None, background=(255, 255, 255),
+                 workers=None, processes=False, compress_level=None, webp_quality=None, store=default_store):
+    # Writes the grid of the first rows*cols `paths` to `output`. Cells default to the
+    # size of the first image; other images are resized to it.
+    paths = list(paths)[:rows * cols]
+    if not paths:
+        raise ValueError("No images to compose.")
+    cell_size = tuple(cell_size or store.size(paths[0]))
+    offsets = grid_layout(len(paths), rows, cols, cell_size)
+    shape = (rows * cell_size[1], cols * cell_size[0], 3)
+    workers = min(len(paths), workers or os.cpu_count() or 1)
+
+    with timer.stage('compose', tiles=len(paths)):
+        if processes and workers > 1:
+            canvas = _fill_shared(shape, background, paths, cell_size, offsets, store, workers)
+        else:
+            canvas = np.empty(shape, dtype=np.uint8)
+            canvas[:] = background
+            _fill(canvas, paths, cell_size, offsets, store, workers)
+    with timer.stage('encode'):
+        save_image(Image.fromarray(canvas, 'RGB'), output, compress_level, webp_quality)
+    return output
+
+
+def check_same_size(paths):
+    # Header-only check that every image has the size of the first
+    sizes = {path: image_size(path) for path in paths}
+    first = sizes[paths[0]]
+    mismatched = [path for path, size in sizes.items() if size != first]
+    if mismatched:
+        raise ValueError(f"All images must be the same size ({first[0]}x{first[1]}); "
+                         f"differs: {', '.join(mismatched)}")
+    return first
+
+
+def add_arguments(parser):
+    # Options shared by the grid scripts
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Tiles decoded and resized concurrently (default: number of CPUs)')
+    parser.add_argument('--processes', action='store_true',
+                        help='Use worker processes writing into a shared-memory canvas instead of threads')
+    parser.add_argument('--compress-level', type=int, choices=range(10), default=None, metavar='0-9',
+                        help="PNG compression level (default: zlib's, 6)")
+    parser.add_argument('--fast-thumbs', action='store_true',
+                        help='Downscale large images through a halving pyramid (faster; pixels differ '
+                             'slightly from a direct resize)')
+    parser.add_argument('--webp', action='store_true', help='Write .webp grids instead of .png')
+    parser.add_argument('--webp-quality', type=int, default=None,
+                        help='Lossy WebP quality 0-100 (default: lossless)')
+
+
+def grid_options(args):
+    options = {'workers': args.workers, 'processes': args.processes,
+               'compress_level': args.compress_level, 'webp_quality': args.webp_quality}
+    if args.fast_thumbs:
+        options['store'] = ImageStore(exact=False)
+    return options
@@ -0,0 +1,99 @@
+import os
+import glob
+import struct
+import hashlib
+import threading
+from PIL import Image
+
+# Shared image store for the PIL grid composers. Sizes come from the PNG header
+# alone, and downscaled copies (grid-cell sizes, plus a halving pyramid for inexact
+# stores) are kept on disk next to a hash of the source path, tagged with the
+# source's mtime and size so a re-rendered PNG invalidates its thumbnails.
+THUMB_DIR = '.thumbs'
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def image_size(path):
+    # (width, height) without decoding: PNG IHDR directly, anything else via PIL's lazy open
+    with open(path, 'rb') as f:
+        head = f.read(24)
+    if head[:8] == PNG_SIGNATURE and head[12:16] == b'IHDR':
+        return struct.unpack('>II', head[16:24])
+    with Image.open(path) as im:
+        return im.size
+
+
+class ImageStore:
+    def __init__(self, thumb_dir=THUMB_DIR, exact=True):
+        self.thumb_dir = thumb_dir
+        # Exact stores resize every cell straight from the source, so cells match a
+        # direct LANCZOS resize pixel for pixel. Inexact ones start large downscales
+        # from the smallest pyramid level that covers the cell: faster, but the
+        # pixels differ slightly.
+        self.exact = exact
+
+    def size(self, path):
+        return image_size(path)
+
+    def _prefix(self, path):
+        return hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+
+    def _thumb_path(self, path, tag):
+        st = os.stat(path)
+        return os.path.join(self.thumb_dir, f'{self._prefix(path)}_{st.st_mtime_ns}_{st.st_size}_{tag}.png')
+
+    def _purge_stale(self, path):
+        # Drop thumbnails left over from older versions of the source image
+        st = os.stat(path)
+        current = f'{self._prefix(path)}_{st.st_mtime_ns}_{st.st_size}_'
+        for old in glob.glob(os.path.join(self.thumb_dir, f'{self._prefix(path)}_*.png')):
+            if not os.path.basename(old).startswith(current):
+                os.remove(old)
+
+    def _save(self, im, thumb_path):
+        os.makedirs(self.thumb_dir, exist_ok=True)
+        tmp_path = f'{thumb_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        im.save(tmp_path, format='PNG')
+        os.replace(tmp_path, thumb_path)
+
+    def _level(self, path, level):
+        # Pyramid level k is the source halved k times; built from level k-1 on demand
+        if level == 0:
+            return Image.open(path).convert('RGB')
+        thumb_path = self._thumb_path(path, f'L{level}')
+        if os.path.exists(thumb_path):
+            return Image.open(thumb_path).convert('RGB')
+        if level == 1:
+            self._purge_stale(path)
+        im = self._level(path, level - 1).reduce(2)
+        self._save(im, thumb_path)
+        return im
+
+    def get(self, path, size=None):
+        # The image at `size` (width, height), or at its native size when size is None
+        native = self.size(path)
+        if size is None or tuple(size) == tuple(native):
+            return Image.open(path).convert('RGB')
+        width, height = size
+        cell_path = self._thumb_path(path, f'{width}x{height}' if self.exact else f'{width}x{height}p')
+        if os.path.exists(cell_path):
+            return Image.open(cell_path).convert('RGB')
+
+        # Start from the smallest pyramid level that is still at least the target size
+        level = 0
+        while not self.exact and native[0] >> (level + 1) >= width and native[1] >> (level + 1) >= height:
+            level += 1
+        if level == 0:
+            # Resized in the source's own mode (RGBA premultiplied, palettes nearest)
+            # and only then converted, like pasting a resized image onto an RGB canvas
+            self._purge_stale(path)
+            im = Image.open(path)
+        else:
+            im = self._level(path, level)
+        im = im.resize((width, height), resample=Image.Resampling.LANCZOS).convert('RGB')
+        self._save(im, cell_path)
+        return im
+
+
+default_store = ImageStore()
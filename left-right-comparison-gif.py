@@ -1,6 +1,8 @@
 import os
 import re
+import argparse
 from PIL import Image
+from anim_writer import open_animation
 
 # Configuration
 folder_x = 'LCS-seasons-images'
@@ -21,43 +23,45 @@ def collect_images(folder):
             file_map[(season, year)] = os.path.join(folder, fname)
     return file_map
 
-img_map_x = collect_images(folder_x)
-img_map_y = collect_images(folder_y)
-
-# Gather all (season, year) pairs present in BOTH folders, in chronological order
-all_pairs = sorted(
-    set(img_map_x.keys()) & set(img_map_y.keys()),
-    key=lambda pair: (pair[1], season_order.index(pair[0]))
-)
-
-# Build GIF frames
-frames = []
-for season, year in all_pairs:
-    im_x = Image.open(img_map_x[(season, year)])
-    im_y = Image.open(img_map_y[(season, year)])
+def comparison_pairs(img_map_x, img_map_y):
+    # All (season, year) pairs present in BOTH folders, in chronological order
+    return sorted(
+        set(img_map_x.keys()) & set(img_map_y.keys()),
+        key=lambda pair: (pair[1], season_order.index(pair[0]))
+    )
 
-    # Make sure heights match, resize Y if needed
-    if im_x.size[1] != im_y.size[1]:
-        new_width = int(im_y.size[0] * im_x.size[1] / im_y.size[1])
-        im_y = im_y.resize((new_width, im_x.size[1]), resample=Image.Resampling.LANCZOS)
-    # Composite image side-by-side
-    total_width = im_x.size[0] + im_y.size[0]
-    combined = Image.new('RGB', (total_width, im_x.size[1]))
-    combined.paste(im_x, (0, 0))
-    combined.paste(im_y, (im_x.size[0], 0))
-    frames.append(combined)
+def write_comparison_animation(output='seasonal_comparison.gif', max_width=None, shared_palette=False):
+    img_map_x = collect_images(folder_x)
+    img_map_y = collect_images(folder_y)
+    all_pairs = comparison_pairs(img_map_x, img_map_y)
 
-# Save the GIF
-if frames:
-    frames[0].save(
-        'seasonal_comparison.gif',
-        save_all=True,
-        append_images=frames[1:],
-        format='GIF',
-        duration=600,
-        loop=0
-    )
-    print("seasonal_comparison.gif created.")
-else:
-    print("No matching images found in both folders for the given format and order.")
+    # Composite, quantize and write one frame at a time
+    if all_pairs:
+        with open_animation(output, duration=600, shared_palette=shared_palette,
+                            max_width=max_width) as writer:
+            for season, year in all_pairs:
+                with Image.open(img_map_x[(season, year)]) as im_x, Image.open(img_map_y[(season, year)]) as im_y:
+                    # Make sure heights match, resize Y if needed
+                    if im_x.size[1] != im_y.size[1]:
+                        new_width = int(im_y.size[0] * im_x.size[1] / im_y.size[1])
+                        im_y = im_y.resize((new_width, im_x.size[1]), resample=Image.Resampling.LANCZOS)
+                    # Composite image side-by-side
+                    total_width = im_x.size[0] + im_y.size[0]
+                    combined = Image.new('RGB', (total_width, im_x.size[1]))
+                    combined.paste(im_x, (0, 0))
+                    combined.paste(im_y, (im_x.size[0], 0))
+                writer.add(combined)
+        print(f"{output} created.")
+    else:
+        print("No matching images found in both folders for the given format and order.")
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Side-by-side LCS vs satellite seasonal animation.')
+    parser.add_argument('--output', default='seasonal_comparison.gif',
+                        help='Output .gif, or .mp4/.webm when ffmpeg is installed (default: seasonal_comparison.gif)')
+    parser.add_argument('--max-width', type=int, default=None,
+                        help='Downscale combined frames to at most this width')
+    parser.add_argument('--shared-palette', action='store_true',
+                        help='Quantize every frame to the first frame\'s palette')
+    args = parser.parse_args()
+    write_comparison_animation(args.output, args.max_width, args.shared_palette)
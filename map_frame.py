@@ -0,0 +1,132 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from derived_fields import quiver_grid
+from stage_timer import timer
+
+
+class MapFrame:
+    # A figure whose static artists (axes, land/coastlines, gridlines, colorbar)
+    # are built once. Each frame then only swaps the pcolormesh data, the quiver
+    # UVs and the title before savefig.
+    def __init__(self, fig, ax, mesh, quiver, title, lon, lat, step):
+        self.fig = fig
+        self.ax = ax
+        self.mesh = mesh
+        self.quiver = quiver
+        self.title = title
+        self.lon = np.asarray(lon)
+        self.lat = np.asarray(lat)
+        self.step = step
+
+    def matches(self, lon, lat):
+        return np.array_equal(self.lon, lon) and np.array_equal(self.lat, lat)
+
+    def update(self, C, U, V, title, decimated=False):
+        # decimated: U and V are already every step-th cell (derived_fields quiver_U/V)
+        step = self.step
+        if not decimated:
+            U, V = U[::step, ::step], V[::step, ::step]
+        self.mesh.set_array(C)
+        self.quiver.set_UVC(U, V)
+        self.title.set_text(title)
+
+    def save(self, filename, dpi=200):
+        # Draws every artist (cartopy features are rasterized here) and encodes the PNG
+        with timer.stage('savefig'):
+            self.fig.savefig(filename, dpi=dpi)
+
+    def close(self):
+        plt.close(self.fig)
+
+
+def season_frame(lon, lat, C, U, V, title, step=8, scale_val=30, extent=(75, 100, 5, 30), decimated=False):
+    # Cartopy map used by the seasonal Bay of Bengal plots
+    import cartopy.crs as ccrs
+    import cartopy.feature as cfeature
+
+    # Prepare custom colormap with over/under colors for out-of-bounds
+    cmap = plt.get_cmap('RdBu_r').copy()
+    light_grey = '#D3D3D3'
+    cmap.set_over(light_grey)
+    cmap.set_under(light_grey)
+
+    LON, LAT = np.meshgrid(lon, lat)
+
+    fig = plt.figure(figsize=(10, 8))
+    ax = plt.axes(projection=ccrs.PlateCarree())
+    pc = ax.pcolormesh(LON, LAT, C, cmap=cmap, shading='gouraud',
+                       vmin=-0.3, vmax=0.3, transform=ccrs.PlateCarree())
+    fig.colorbar(pc, label='Wind Vector Magnitude (cm/s)', extend='both', ax=ax)
+    if not decimated:
+        U, V = U[::step, ::step], V[::step, ::step]
+    QLON, QLAT = quiver_grid(lon, lat, step)
+    q = ax.quiver(QLON, QLAT, U, V,
+                  scale=scale_val, color='k', width=0.002, headwidth=3, transform=ccrs.PlateCarree())
+    with timer.stage('features'):
+        # Add bold landlines and coastlines with white landmass
+        ax.add_feature(cfeature.LAND, facecolor='white', edgecolor='black', linewidth=1.5)
+        ax.coastlines(linewidth=1.5)
+        # Set extent to Bay of Bengal region
+        ax.set_extent(list(extent), crs=ccrs.PlateCarree())
+
+        # Add gridlines with labels
+        gl = ax.gridlines(draw_labels=True, linewidth=1.2, color='gray', alpha=0.7, linestyle='--')
+        gl.top_labels = False
+        gl.right_labels = False
+        gl.xlabel_style = {'size': 12, 'weight': 'bold'}
+        gl.ylabel_style = {'size': 12, 'weight': 'bold'}
+
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+    title_text = ax.set_title(title, fontsize=14)
+    with timer.stage('tight_layout'):
+        fig.tight_layout()
+    return MapFrame(fig, ax, pc, q, title_text, lon, lat, step)
+
+
+def daily_frame(lon, lat, C, U, V, title, step=8, scale_val=100):
+    # Plain lon/lat map used by the daily plots
+    # Adding a reference text for constant vector magnitude
+    constant_magnitude = scale_val / 5  # Adjust divisor as needed for your reference
+
+    LON, LAT = np.meshgrid(lon, lat)
+
+    fig = plt.figure(figsize=(10, 8))
+    ax = plt.gca()
+    cmap = plt.get_cmap('RdBu_r')  # Choose a colormap
+    pc = ax.pcolormesh(LON, LAT, C, cmap=cmap, shading='auto', vmin=-30, vmax=30)
+    fig.colorbar(pc, label='pn', ax=ax)
+
+    # Quiver (vector field)
+    # To avoid clutter, plot every Nth arrow
+    q = ax.quiver(LON[::step, ::step], LAT[::step, ::step], U[::step, ::step], V[::step, ::step],
+                  scale=scale_val, color='k', width=0.002, headwidth=3)
+    # Add the reference text at the bottom of the image
+    ax.text(0.5, 0.02, f'Constant vector magnitude reference: {constant_magnitude:.1f} cm/s',
+            ha='center', va='center', transform=fig.transFigure, fontsize=10, color='black')
+
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+    title_text = ax.set_title(title)
+    with timer.stage('tight_layout'):
+        fig.tight_layout()
+    return MapFrame(fig, ax, pc, q, title_text, lon, lat, step)
+
+
+def field_frame(lon, lat, C, U, V, title, step=8, scale_val=100, vmin=-10, vmax=10):
+    # Plain lon/lat map of the whole domain used by the Task2 mode plots
+    LON, LAT = np.meshgrid(lon, lat)
+
+    fig = plt.figure(figsize=(10, 8))
+    ax = plt.gca()
+    pc = ax.pcolormesh(LON, LAT, C, cmap='RdYlBu_r', shading='auto', vmin=vmin, vmax=vmax)
+    fig.colorbar(pc, label='pn', ax=ax)
+    q = ax.quiver(LON[::step, ::step], LAT[::step, ::step], U[::step, ::step], V[::step, ::step],
+                  scale=scale_val, color='k', width=0.002, headwidth=3)
+
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+    title_text = ax.set_title(title)
+    with timer.stage('tight_layout'):
+        fig.tight_layout()
+    return MapFrame(fig, ax, pc, q, title_text, lon, lat, step)
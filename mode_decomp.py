@@ -0,0 +1,301 @@
+import os
+import argparse
+import numpy as np
+from nc_region import BACKEND_HELP, BACKENDS, open_dataset, region_slices, read_region, year_source
+from prefetch import prefetch
+from regions import polygon_mask, select_regions
+
+# EOF / mode decomposition of the daily un, vn, pn fields behind the Task2 mode plots
+# (vector_scalar_field_12_mode_1, _mode_2, _mode_3-10, _mode_all).
+#
+# Each day is one column of a space x time matrix X: the un, vn and pn values of every
+# cell that is valid on all days (the ocean), centred on the time mean and divided by
+# one standard deviation per variable so pn does not swamp the winds. The leading modes
+# come from a randomized SVD (Halko, Martinsson & Tropp) that streams X in blocks of
+# days, so any number of years can be decomposed without holding X in memory:
+#
+#   pass 1      sketch Y = X @ Omega, plus the per-cell sums giving the mean and scaling
+#   (power)     Y = X @ (X.T @ Q), one pass each, sharpens the spectrum (--power)
+#   last pass   B = Q.T @ X; the SVD of the small B gives the modes and daily coefficients
+#
+# The factorization is saved once; "mode 1", "modes 3-10" and "all modes" maps of any
+# day are then reconstructions from it, not new decompositions.
+#
+#   python mode_decomp.py 12 23 --modes 20 --output modes_12_23.npz
+#   python mode_decomp.py --load modes_12_23.npz --plot 12 --day 10 --subsets 1 2 3-10 all
+
+VARIABLES = ('un', 'vn', 'pn')
+OVERSAMPLE = 10
+BLOCK_DAYS = 32
+
+
+def read_blocks(sources, variables=VARIABLES, region=None, block_days=BLOCK_DAYS, backend='netcdf4'):
+    # (year, first_day, block) for consecutive day blocks of every source; block is a
+    # float64 (n_variables, days, lat, lon) array with NaN for missing cells
+    for year, source in sources:
+        with open_dataset(source, backend) as ds:
+            lat_slice, lon_slice = slice(None), slice(None)
+            if region is not None:
+                lat_slice, lon_slice = region_slices(ds.variables['lat'][:], ds.variables['lon'][:], region)
+            n_days = ds.variables[variables[0]].shape[0]
+            for start in range(0, n_days, block_days):
+                days = slice(start, min(start + block_days, n_days))
+                yield year, start, np.stack([read_region(ds.variables[name], days, lat_slice, lon_slice)
+                                             for name in variables]).astype(np.float64)
+
+
+class ModeSet:
+    # A saved factorization: X ~= modes @ diag(singular_values) @ coefficients.T
+    def __init__(self, variables, lat, lon, mask, mean, scale, modes, singular_values,
+                 coefficients, days, total_variance):
+        self.variables = tuple(variables)
+        self.lat = np.asarray(lat)
+        self.lon = np.asarray(lon)
+        self.mask = np.asarray(mask, dtype=bool)            # (lat, lon) cells in the state vector
+        self.mean = np.asarray(mean)                        # (n_variables, n_cells) time mean
+        self.scale = np.asarray(scale)                      # (n_variables,) standard deviations
+        self.modes = np.asarray(modes)                      # (n_variables * n_cells, k) spatial patterns
+        self.singular_values = np.asarray(singular_values)  # (k,)
+        self.coefficients = np.asarray(coefficients)        # (n_days, k) unit-norm time series
+        self.days = np.asarray(days)                        # (n_days, 2) (year, day index) of each column
+        self.total_variance = float(total_variance)
+
+    @property
+    def explained(self):
+        # Fraction of the (scaled) variance carried by each mode
+        return self.singular_values**2 / self.total_variance
+
+    def save(self, path):
+        np.savez(path, variables=np.array(self.variables), lat=self.lat, lon=self.lon, mask=self.mask,
+                 mean=self.mean, scale=self.scale, modes=self.modes, singular_values=self.singular_values,
+                 coefficients=self.coefficients, days=self.days, total_variance=self.total_variance)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            return cls(**{name: npz[name] for name in npz.files})
+
+    def column(self, year, day):
+        matches = np.flatnonzero((self.days[:, 0] == int(year)) & (self.days[:, 1] == int(day)))
+        if matches.size == 0:
+            raise KeyError(f"Year {year} day {day} is not in the decomposition.")
+        return int(matches[0])
+
+    def reconstruct(self, year, day, modes=None, anomaly=False):
+        # {variable: (lat, lon) map} rebuilt from the given mode indices (0-based;
+        # None = all), plus the time mean unless anomaly=True. Cells outside the mask are NaN.
+        modes = np.arange(self.modes.shape[1]) if modes is None else np.asarray(modes, dtype=np.intp)
+        t = self.column(year, day)
+        weights = self.singular_values[modes] * self.coefficients[t, modes]
+        state = (self.modes[:, modes] @ weights).reshape(len(self.variables), -1) * self.scale[:, None]
+        if not anomaly:
+            state = state + self.mean
+        fields = {}
+        for k, name in enumerate(self.variables):
+            field = np.full(self.mask.shape, np.nan, dtype=np.float32)
+            field[self.mask] = state[k]
+            fields[name] = field
+        return fields
+
+
+def decompose(sources, n_modes=10, variables=VARIABLES, region=None, block_days=BLOCK_DAYS,
+              power=1, oversample=OVERSAMPLE, seed=0, backend='netcdf4', read_ahead=1):
+    # Randomized SVD of the scaled anomaly matrix, streamed over day blocks of `sources`
+    # ((year, source) pairs, as from multi_year_clim.find_year_files)
+    rank = n_modes + oversample
+    rng = np.random.default_rng(seed)
+    if not sources:
+        raise ValueError("No data to decompose.")
+    # Read before any prefetch starts: netCDF calls must not overlap the reading thread's
+    lat, lon = block_grid(sources[0][1], region, backend)
+
+    def blocks():
+        return prefetch(read_blocks(sources, variables, region, block_days, backend), read_ahead,
+                        name='read_blocks')
+
+    # Pass 1: sketch of the raw data, and per-cell sums for the mean and the scaling
+    sketch = sums = squares = valid = None
+    omega_sum = np.zeros(rank)
+    days = []
+    for year, start, block in blocks():
+        n_vars, n_days = block.shape[:2]
+        flat = block.reshape(n_vars, n_days, -1)
+        if sketch is None:
+            sketch = np.zeros((n_vars, flat.shape[2], rank))
+            sums = np.zeros((n_vars, flat.shape[2]))
+            squares = np.zeros((n_vars, flat.shape[2]))
+            valid = np.zeros(flat.shape[2], dtype=np.int64)
+        finite = np.isfinite(flat)
+        valid += finite.all(axis=0).sum(axis=0)
+        flat = np.where(finite, flat, 0)
+        omega = rng.standard_normal((n_days, rank))
+        sketch += np.einsum('vtc,tr->vcr', flat, omega)
+        omega_sum += omega.sum(axis=0)
+        sums += flat.sum(axis=1)
+        squares += (flat**2).sum(axis=1)
+        days.extend((year, start + k) for k in range(n_days))
+    if sketch is None:
+        raise ValueError("No data to decompose.")
+
+    # Keep the cells valid in every variable on every day (and inside the region's polygon)
+    n_total = len(days)
+    keep = valid == n_total
+    if region is not None and 'polygon' in region:
+        keep &= polygon_mask(lat, lon, region['polygon']).ravel()
+    cells = np.flatnonzero(keep)
+    if cells.size == 0:
+        raise ValueError("No cell is valid on every day.")
+    mean = sums[:, cells] / n_total
+    variance = (squares[:, cells] / n_total - mean**2).mean(axis=1)
+    scale = np.sqrt(np.maximum(variance, np.finfo(np.float64).tiny))
+    # Centre and scale the sketch: (X - mean) @ Omega = X @ Omega - mean * sum(Omega)
+    sketch = (sketch[:, cells] - mean[:, :, None] * omega_sum) / scale[:, None, None]
+    Q = np.linalg.qr(sketch.reshape(-1, rank))[0]
+
+    def anomaly_columns(block):
+        flat = block.reshape(block.shape[0], block.shape[1], -1)[:, :, cells]
+        return ((flat - mean[:, None, :]) / scale[:, None, None]).transpose(0, 2, 1).reshape(-1, block.shape[1])
+
+    # Power passes: Y = X (X^T Q), one block of days at a time
+    for _ in range(power):
+        Y = np.zeros_like(Q)
+        for _, _, block in blocks():
+            X = anomaly_columns(block)
+            Y += X @ (X.T @ Q)
+        Q = np.linalg.qr(Y)[0]
+
+    # Last pass: project every day onto the basis
+    B = np.empty((rank, n_total))
+    total_variance = 0.0
+    column = 0
+    for _, _, block in blocks():
+        X = anomaly_columns(block)
+        B[:, column:column + X.shape[1]] = Q.T @ X
+        total_variance += float((X**2).sum())
+        column += X.shape[1]
+
+    U_small, S, Vt = np.linalg.svd(B, full_matrices=False)
+    mask = np.zeros(lat.size * lon.size, dtype=bool)
+    mask[cells] = True
+    return ModeSet(variables, lat, lon, mask.reshape(lat.size, lon.size), mean.astype(np.float32),
+                   scale, (Q @ U_small[:, :n_modes]).astype(np.float32), S[:n_modes],
+                   Vt[:n_modes].T.astype(np.float32), np.array(days, dtype=np.int32), total_variance)
+
+
+def block_grid(source, region=None, backend='netcdf4'):
+    # lat/lon of the cells read_blocks returns
+    with open_dataset(source, backend) as ds:
+        lat = np.asarray(ds.variables['lat'][:])
+        lon = np.asarray(ds.variables['lon'][:])
+    if region is None:
+        return lat, lon
+    lat_slice, lon_slice = region_slices(lat, lon, region)
+    return lat[lat_slice], lon[lon_slice]
+
+
+def parse_subset(spec, n_modes):
+    # '1' -> [0], '3-10' -> [2..9], 'all' -> every mode; labels are 1-based like the figures
+    if spec == 'all':
+        return list(range(n_modes))
+    first, _, last = spec.partition('-')
+    first, last = int(first), int(last or first)
+    if not 1 <= first <= last <= n_modes:
+        raise ValueError(f"Mode subset {spec!r} is outside 1-{n_modes}.")
+    return list(range(first - 1, last))
+
+
+def default_subsets(n_modes):
+    # The Task2 figures' subsets 1, 2, 3-10 and all, cut to the modes there are
+    subsets = [spec for spec in ('1', '2') if int(spec) <= n_modes]
+    if n_modes >= 3:
+        subsets.append(f'3-{min(10, n_modes)}')
+    return subsets + ['all']
+
+
+def parse_subsets(specs, n_modes):
+    # Every spec parsed up front, so a bad one fails before any figure is written
+    return {spec: parse_subset(spec, n_modes) for spec in specs}
+
+
+def plot_subsets(mode_set, year, day, subsets=None, output_dir='.', anomaly=False):
+    # One vector/scalar map per mode subset of one day, named like the Task2 figures;
+    # the figure is built once and only its data is swapped per subset
+    from map_frame import field_frame
+
+    n_modes = mode_set.modes.shape[1]
+    subsets = parse_subsets(subsets or default_subsets(n_modes), n_modes)
+    os.makedirs(output_dir, exist_ok=True)
+    frame = None
+    written = []
+    for spec, modes in subsets.items():
+        fields = mode_set.reconstruct(year, day, modes, anomaly)
+        title = f'Vector and Scalar Field at time index {day}'
+        if frame is None:
+            frame = field_frame(mode_set.lon, mode_set.lat, fields['pn'], fields['un'], fields['vn'], title)
+        else:
+            frame.update(fields['pn'], fields['un'], fields['vn'], title)
+        filename = os.path.join(output_dir, f'vector_scalar_field_{year}_mode_{spec}.png')
+        frame.save(filename, dpi=200)
+        print(f"Saved plot: {filename}")
+        written.append(filename)
+    if frame is not None:
+        frame.close()
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='EOF/mode decomposition of the daily un, vn, pn fields.')
+    parser.add_argument('years', nargs='*', help='Year numbers to decompose together')
+    parser.add_argument('--modes', type=int, default=10, help='Number of modes kept (default: 10)')
+    parser.add_argument('--region', default=None, help='Region name from regions.REGIONS (default: full domain)')
+    parser.add_argument('--block-days', type=int, default=BLOCK_DAYS,
+                        help=f'Days per block streamed through the SVD (default: {BLOCK_DAYS})')
+    parser.add_argument('--power', type=int, default=1,
+                        help='Power iterations, one extra pass over the data each (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the sketch (default: 0)')
+    parser.add_argument('--output', default=None, help='Save the factorization here (default: modes_<years>.npz)')
+    parser.add_argument('--load', default=None, help='Use a saved factorization instead of decomposing')
+    parser.add_argument('--plot', nargs='*', default=None, metavar='YEAR',
+                        help='Plot these years (default with no YEAR: every decomposed year)')
+    parser.add_argument('--day', type=int, default=10, help='Day (time index) to plot (default: 10)')
+    parser.add_argument('--subsets', nargs='+', default=None,
+                        help="Mode subsets, one figure each: N, N-M or all "
+                             "(default: 1 2 3-10 all, cut to --modes)")
+    parser.add_argument('--anomaly', action='store_true', help='Plot the modes without the time mean')
+    parser.add_argument('--output-dir', default='.', help='Directory for the figures (default: .)')
+    parser.add_argument('--backend', choices=BACKENDS, default='netcdf4',
+                        help=BACKEND_HELP)
+    parser.add_argument('--store', default=None,
+                        help='Read the years from this chunked store (see chunked_store.py)')
+    parser.add_argument('--read-ahead', type=int, default=1,
+                        help='Day blocks read on a background thread ahead of the SVD (default: 1)')
+    args = parser.parse_args()
+
+    def check_subsets(n_modes):
+        try:
+            parse_subsets(args.subsets or default_subsets(n_modes), n_modes)
+        except ValueError as exc:
+            parser.error(str(exc))
+
+    if args.load:
+        mode_set = ModeSet.load(args.load)
+    else:
+        if not args.years:
+            parser.error('give the years to decompose, or --load a saved factorization')
+        if args.plot is not None:
+            check_subsets(args.modes)  # before the decomposition
+        region = select_regions([args.region])[args.region] if args.region else None
+        sources = [(int(year), year_source(year, args.store)) for year in args.years]
+        mode_set = decompose(sources, args.modes, VARIABLES, region, args.block_days, args.power,
+                             seed=args.seed, backend=args.backend, read_ahead=args.read_ahead)
+        output = args.output or f"modes_{'_'.join(args.years)}.npz"
+        mode_set.save(output)
+        print(f"Modes written to: {output}")
+    for k, fraction in enumerate(mode_set.explained, 1):
+        print(f"Mode {k}: {100 * fraction:.2f}% of variance")
+
+    if args.plot is not None:
+        check_subsets(mode_set.modes.shape[1])
+        years = args.plot or sorted({int(year) for year in mode_set.days[:, 0]})
+        for year in years:
+            plot_subsets(mode_set, year, args.day, args.subsets, args.output_dir, args.anomaly)
@@ -1,5 +1,6 @@
 import os
-from PIL import Image
+import argparse
+from grid_compositor import add_arguments, check_same_size, compose_grid, grid_options
 
 # Configuration
 folder = 'monthly_images'
@@ -16,36 +17,33 @@ months = [
 grid_rows = 3
 grid_cols = 4
 
-# Collect image paths in monthly order
-image_filenames = [
-    f"year{year}-{month}-average.png" for month in months
-]
-image_paths = [os.path.join(folder, fname) for fname in image_filenames]
-
-# Check that all images exist and open them
-images = []
-for path in image_paths:
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Missing image: {path}")
-    images.append(Image.open(path))
-
-# All images must be the same size
-img_w, img_h = images[0].size
-for img in images:
-    if img.size != (img_w, img_h):
-        raise ValueError("All images must be the same size.")
-
-# Create the output grid image
-grid_img = Image.new('RGB', (grid_cols * img_w, grid_rows * img_h))
-
-# Paste each image into the right place
-for idx, img in enumerate(images):
-    row = idx // grid_cols
-    col = idx % grid_cols
-    grid_img.paste(img, (col * img_w, row * img_h))
-
-# Save the grid image
-output_path = os.path.join(folder, f'year{year}_monthly_grid.png')
-grid_img.save(output_path)
-print(f"Grid image saved to {output_path}")
 
+def combine_months(folder=folder, year=year, ext='png', **options):
+    # Collect image paths in monthly order
+    image_filenames = [
+        f"year{year}-{month}-average.png" for month in months
+    ]
+    image_paths = [os.path.join(folder, fname) for fname in image_filenames]
+
+    # Check that all images exist
+    for path in image_paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Missing image: {path}")
+
+    # All images must be the same size (read from the headers, before any decoding)
+    img_w, img_h = check_same_size(image_paths)
+
+    # Decode and paste in parallel onto a black canvas, then save the grid image
+    output_path = os.path.join(folder, f'year{year}_monthly_grid.{ext}')
+    compose_grid(image_paths, output_path, grid_rows, grid_cols, (img_w, img_h), (0, 0, 0), **options)
+    print(f"Grid image saved to {output_path}")
+    return output_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Combine the twelve monthly average images of a year into a 3x4 grid.')
+    parser.add_argument('--folder', default=folder, help=f'Folder with the monthly images (default: {folder})')
+    parser.add_argument('--year', type=int, default=year, help=f'Year number in the file names (default: {year})')
+    add_arguments(parser)
+    args = parser.parse_args()
+    combine_months(args.folder, args.year, 'webp' if args.webp else 'png', **grid_options(args))
@@ -0,0 +1,233 @@
+import os
+import re
+import glob
+import argparse
+import numpy as np
+from contextlib import closing
+from clim_cache import CACHE_DIR, ClimCache
+from nc_region import BACKEND_HELP, BACKENDS, BAY_OF_BENGAL, open_dataset, region_slices, read_region
+from fill_values import nan_mean, to_masked
+from prefetch import nc_lock, prefetch
+from season_reducer import SEASON_DAYS, season_index, grouped_sums
+from static_mask import region_mask
+
+VARIABLES = ('un', 'vn', 'pn')
+
+
+def find_year_files(root='.'):
+    # All Year_N/year_N_combined.nc files under root, as (N, path) sorted by N
+    files = []
+    for path in glob.glob(os.path.join(root, 'Year_*', 'year_*_combined.nc')):
+        m = re.search(r'year_(\d+)_combined\.nc$', path)
+        if m:
+            files.append((int(m.group(1)), path))
+    return sorted(files)
+
+
+def region_grid(path, region=None, backend='netcdf4'):
+    # Coordinates and hyperslab slices for `region` (None = full domain)
+    with open_dataset(path, backend) as ds:
+        lon = ds.variables['lon'][:]
+        lat = ds.variables['lat'][:]
+    if region is None:
+        return lat, lon, slice(None), slice(None)
+    lat_slice, lon_slice = region_slices(lat, lon, region)
+    return lat[lat_slice], lon[lon_slice], lat_slice, lon_slice
+
+
+def season_fields(path, variables=VARIABLES, region=None, cache=None, backend='netcdf4'):
+    # Season means (season, lat, lon) of each variable for one year file, cached per variable
+    def compute(name):
+        lat_slice, lon_slice = region_grid(path, region, backend)[2:]
+        with open_dataset(path, backend) as ds:
+            block = read_region(ds.variables[name], None, lat_slice, lon_slice)
+            # Sum the ocean cells only, once static_mask.py has checked the file
+            mask = region_mask(path, ds, lat_slice, lon_slice)
+            if mask is not None:
+                block = mask.pack(block)
+        idx = season_index(block.shape[0], SEASON_DAYS)
+        sums, counts = grouped_sums(block, idx, len(SEASON_DAYS))
+        if mask is not None:
+            sums, counts = mask.unpack(sums, 0), mask.unpack(counts, 0)
+        return {'mean': nan_mean(sums, counts)}
+
+    fields = {}
+    for name in variables:
+        if cache is None:
+            fields[name] = compute(name)['mean']
+        else:
+            fields[name] = cache.cached(lambda: compute(name), path, name, region,
+                                        mode='season', seasons=list(SEASON_DAYS))['mean']
+    return fields
+
+
+def day_fields(path, variables=VARIABLES, region=None, backend='netcdf4'):
+    # Daily (time, lat, lon) fields of each variable for one year file. Read directly:
+    # full daily blocks are as slow to load from the cache as from the file, and would
+    # crowd the small season means out of it.
+    lat_slice, lon_slice = region_grid(path, region, backend)[2:]
+    with open_dataset(path, backend) as ds:
+        return {name: read_region(ds.variables[name], None, lat_slice, lon_slice)
+                for name in variables}
+
+
+def year_fields(path, mode, variables=VARIABLES, region=None, cache=None, backend='netcdf4'):
+    if mode == 'season':
+        return season_fields(path, variables, region, cache, backend)
+    return day_fields(path, variables, region, backend)
+
+
+class Climatology:
+    # Running per-cell mean and variance (Welford) over years, one (group, lat, lon)
+    # field at a time; missing (NaN) cells do not count towards that cell's statistics.
+    def __init__(self):
+        self.count = None
+        self.mean = None
+        self.m2 = None
+
+    def update(self, field):
+        valid = ~np.isnan(field)
+        x = np.where(valid, field, 0).astype(np.float64)
+        if self.count is None:
+            self.count = np.zeros(x.shape, dtype=np.int64)
+            self.mean = np.zeros(x.shape, dtype=np.float64)
+            self.m2 = np.zeros(x.shape, dtype=np.float64)
+        elif x.shape[0] > self.count.shape[0]:
+            # Longer than the years so far (an earlier file was a day short): the new
+            # groups start empty
+            grow = ((0, x.shape[0] - self.count.shape[0]),) + ((0, 0),) * (x.ndim - 1)
+            self.count = np.pad(self.count, grow)
+            self.mean = np.pad(self.mean, grow)
+            self.m2 = np.pad(self.m2, grow)
+        n = x.shape[0]  # a year file may be a day short
+        count, mean, m2 = self.count[:n], self.mean[:n], self.m2[:n]
+
+        count += valid
+        delta = np.where(valid, x - mean, 0)
+        mean += np.divide(delta, count, out=np.zeros_like(delta), where=valid)
+        m2 += delta * np.where(valid, x - mean, 0)
+        return self
+
+    def mean_field(self):
+        return np.where(self.count > 0, self.mean, np.nan).astype(np.float32)
+
+    def std_field(self, ddof=1):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = self.m2 / (self.count - ddof)
+        return np.where(self.count > ddof, np.sqrt(var), np.nan).astype(np.float32)
+
+
+def read_years(files, mode, variables=VARIABLES, region=None, cache=None, backend='netcdf4', read_ahead=1):
+    # (year, path, fields) for each file; the next `read_ahead` years are read while
+    # the current one is processed, so at most read_ahead + 2 years are in memory.
+    # read_ahead=0 reads inline and holds one year at a time.
+    loads = ((year, path, year_fields(path, mode, variables, region, cache, backend)) for year, path in files)
+    return prefetch(loads, read_ahead, name='read_years')
+
+
+def accumulate(files, mode='season', variables=VARIABLES, region=None, cache=None, backend='netcdf4',
+               read_ahead=1):
+    # Stream the year files once, holding only a few years in memory at a time
+    clim = {name: Climatology() for name in variables}
+    for year, path, fields in read_years(files, mode, variables, region, cache, backend, read_ahead):
+        print(f"Accumulating climatology: Year {year} ({path})")
+        for name in variables:
+            clim[name].update(fields[name])
+    return clim
+
+
+def anomalies(files, clim, mode='season', variables=VARIABLES, region=None, cache=None, backend='netcdf4',
+              read_ahead=1):
+    # Yield (year, {variable: field - climatological mean}) one year at a time
+    means = {name: clim[name].mean_field() for name in variables}
+    for year, path, fields in read_years(files, mode, variables, region, cache, backend, read_ahead):
+        yield year, {name: fields[name] - means[name][:fields[name].shape[0]] for name in variables}
+
+
+def write_climatology(output, clim, lat, lon, mode, files, with_anomalies=False,
+                      variables=VARIABLES, region=None, cache=None, backend='netcdf4', read_ahead=1):
+    from netCDF4 import Dataset
+
+    n_groups = next(iter(clim.values())).count.shape[0]
+    with Dataset(output, 'w') as out:
+        out.createDimension('year', None)
+        out.createDimension('group', n_groups)
+        out.createDimension('lat', len(lat))
+        out.createDimension('lon', len(lon))
+        out.mode = mode
+        out.years = ','.join(str(year) for year, _ in files)
+        if mode == 'season':
+            out.season_names = ','.join(SEASON_DAYS)
+        out.createVariable('lat', 'f8', ('lat',))[:] = lat
+        out.createVariable('lon', 'f8', ('lon',))[:] = lon
+        for name in variables:
+            mean = out.createVariable(f'{name}_mean', 'f4', ('group', 'lat', 'lon'),
+                                      zlib=True, fill_value=np.float32(9.969e+36))
+            std = out.createVariable(f'{name}_std', 'f4', ('group', 'lat', 'lon'),
+                                     zlib=True, fill_value=np.float32(9.969e+36))
+            # Missing cells go out as _FillValue
+            mean[:] = to_masked(clim[name].mean_field())
+            std[:] = to_masked(clim[name].std_field())
+            out.createVariable(f'{name}_count', 'i4', ('group', 'lat', 'lon'),
+                               zlib=True)[:] = clim[name].count
+        if with_anomalies:
+            year_var = out.createVariable('year', 'i4', ('year',))
+            anom_vars = {name: out.createVariable(f'{name}_anomaly', 'f4',
+                                                  ('year', 'group', 'lat', 'lon'), zlib=True,
+                                                  fill_value=np.float32(9.969e+36))
+                         for name in variables}
+            # closing() stops the read-ahead before the file is closed, even on errors
+            with closing(anomalies(files, clim, mode, variables, region, cache, backend, read_ahead)) as years:
+                for k, (year, fields) in enumerate(years):
+                    # The next year is being read on the prefetch thread meanwhile
+                    with nc_lock:
+                        year_var[k] = year
+                        for name in variables:
+                            anom_vars[name][k, :fields[name].shape[0]] = to_masked(fields[name])
+                    print(f"Wrote anomalies for Year {year}")
+    print(f"Climatology written to: {output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Multi-year climatology and anomalies from Year_N files.')
+    parser.add_argument('--root', default='.', help='Directory containing the Year_N folders')
+    parser.add_argument('--mode', choices=['season', 'doy'], default='season',
+                        help='Statistics per season or per day of year (default: season)')
+    parser.add_argument('--full-domain', action='store_true',
+                        help='Use the whole grid instead of the Bay of Bengal box')
+    parser.add_argument('--output', default='wind_clim.nc', help='Output NetCDF file')
+    parser.add_argument('--anomalies', action='store_true',
+                        help='Also write per-year anomaly fields')
+    parser.add_argument('--backend', choices=BACKENDS, default='netcdf4',
+                        help=BACKEND_HELP)
+    parser.add_argument('--store', default=None,
+                        help='Read the years from this chunked store (see chunked_store.py) '
+                             'instead of the Year_N files under --root')
+    parser.add_argument('--read-ahead', type=int, default=None,
+                        help='Years read on a background thread ahead of processing; each one trades another '
+                             'year in memory for speed (default: 1 for season, 0 for doy, whose years are '
+                             'full daily blocks; 0 reads inline, one year at a time)')
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help=f'Directory for cached season means (default: {CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always recompute season means from the NetCDF files')
+    args = parser.parse_args()
+
+    if args.store:
+        from chunked_store import store_years
+        files = store_years(args.store)
+    else:
+        files = find_year_files(args.root)
+    if not files:
+        raise SystemExit(f"No years found in {args.store}" if args.store else
+                         f"No Year_N/year_N_combined.nc files found under {args.root}")
+    region = None if args.full_domain else BAY_OF_BENGAL
+    read_ahead = args.read_ahead
+    if read_ahead is None:
+        read_ahead = 0 if args.mode == 'doy' else 1
+    cache = None if args.no_cache else ClimCache(args.cache_dir)
+    lat, lon = region_grid(files[0][1], region, args.backend)[:2]
+
+    clim = accumulate(files, args.mode, VARIABLES, region, cache, args.backend, read_ahead)
+    write_climatology(args.output, clim, lat, lon, args.mode, files, args.anomalies,
+                      VARIABLES, region, cache, args.backend, read_ahead)
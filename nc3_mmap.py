@@ -0,0 +1,195 @@
+import os
+import struct
+import numpy as np
+
+# Memory-mapped reader for netCDF classic (CDF-1) and 64-bit offset (CDF-2) files,
+# the format of the Year_N/year_N_combined.nc inputs. The header is parsed once and
+# every variable becomes a big-endian view onto one read-only np.memmap of the file:
+# slicing a day or a region is a view served from the page cache, and worker
+# processes that open the same year share one physical copy of it.
+#
+#   with MmapDataset('Year_12/year_12_combined.nc') as ds:
+#       un = ds.variables['un']        # shape (TDAYS, YNEW, XNEW), dtype >f4
+#       day = un[100]                  # no copy
+#
+# Only reading is supported. Use netCDF4 for NETCDF4/HDF5 or CDF-5 files.
+
+NC_DIMENSION = 10
+NC_VARIABLE = 11
+NC_ATTRIBUTE = 12
+
+NC_TYPES = {1: np.dtype('i1'), 2: np.dtype('S1'), 3: np.dtype('>i2'),
+            4: np.dtype('>i4'), 5: np.dtype('>f4'), 6: np.dtype('>f8')}
+
+STREAMING = 0xFFFFFFFF  # numrecs of a file still being written
+
+
+def _padded(n):
+    return (n + 3) & ~3
+
+
+class _HeaderReader:
+    def __init__(self, buf, version):
+        self.buf = buf
+        self.pos = 0
+        self.offset_format = '>i' if version == 1 else '>q'
+
+    def unpack(self, fmt):
+        value, = struct.unpack_from(fmt, self.buf, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return value
+
+    def int(self):
+        return self.unpack('>i')
+
+    def offset(self):
+        return self.unpack(self.offset_format)
+
+    def name(self):
+        n = self.int()
+        name = bytes(self.buf[self.pos:self.pos + n]).decode('utf-8')
+        self.pos += _padded(n)
+        return name
+
+    def values(self, nc_type, n):
+        dtype = NC_TYPES[nc_type]
+        raw = bytes(self.buf[self.pos:self.pos + n * dtype.itemsize])
+        self.pos += _padded(n * dtype.itemsize)
+        if nc_type == 2:
+            return raw.rstrip(b'\x00').decode('utf-8', 'replace')
+        values = np.frombuffer(raw, dtype).astype(dtype.newbyteorder('='))
+        return values[0] if n == 1 else values
+
+    def list_header(self, tag):
+        found, n = self.int(), self.int()
+        if found not in (0, tag) or (found == 0 and n != 0):
+            raise ValueError(f"Malformed netCDF header at byte {self.pos - 8}.")
+        return n
+
+    def attributes(self):
+        attrs = {}
+        for _ in range(self.list_header(NC_ATTRIBUTE)):
+            name = self.name()
+            nc_type = self.int()
+            attrs[name] = self.values(nc_type, self.int())
+        return attrs
+
+
+class MmapVariable:
+    # A netCDF4.Variable look-alike whose data is a memmap-backed ndarray view
+    def __init__(self, name, dimensions, data, attrs):
+        self.name = name
+        self.dimensions = dimensions
+        self.data = data
+        self._attrs = attrs
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    @property
+    def size(self):
+        return self.data.size
+
+    def __len__(self):
+        return len(self.data)
+
+    def ncattrs(self):
+        return list(self._attrs)
+
+    def getncattr(self, name):
+        return self._attrs[name]
+
+    def __getattr__(self, name):
+        attrs = self.__dict__.get('_attrs', {})
+        if name in attrs:
+            return attrs[name]
+        raise AttributeError(name)
+
+    def __getitem__(self, key):
+        # A view into the file; packed variables are unpacked (and so copied) like netCDF4 does
+        block = self.data[key]
+        if 'scale_factor' in self._attrs or 'add_offset' in self._attrs:
+            block = block * self._attrs.get('scale_factor', 1) + self._attrs.get('add_offset', 0)
+        return block
+
+
+class MmapDataset:
+    def __init__(self, path):
+        self.filepath = path
+        size = os.path.getsize(path)
+        mm = np.memmap(path, dtype=np.uint8, mode='r')
+        magic = bytes(mm[:4])
+        if magic[:3] != b'CDF' or magic[3] not in (1, 2):
+            raise ValueError(f"{path} is not a netCDF classic or 64-bit offset file; "
+                             "open it with netCDF4 instead.")
+        version = magic[3]
+        self.data_model = 'NETCDF3_CLASSIC' if version == 1 else 'NETCDF3_64BIT_OFFSET'
+
+        header = _HeaderReader(mm, version)
+        header.pos = 4
+        numrecs = header.unpack('>I')
+
+        dims = []
+        for _ in range(header.list_header(NC_DIMENSION)):
+            dims.append((header.name(), header.int()))
+        record_dim = next((k for k, (_, length) in enumerate(dims) if length == 0), None)
+        self.attrs = header.attributes()
+
+        specs = []
+        for _ in range(header.list_header(NC_VARIABLE)):
+            name = header.name()
+            dimids = [header.int() for _ in range(header.int())]
+            attrs = header.attributes()
+            dtype = NC_TYPES[header.int()]
+            header.int()  # vsize; recomputed below (it saturates for >4 GiB variables)
+            begin = header.offset()
+            specs.append((name, dimids, attrs, dtype, begin))
+
+        # Record variables are interleaved: one record of each, in order, per record
+        is_record = [record_dim is not None and dimids[:1] == [record_dim] for _, dimids, _, _, _ in specs]
+        slab_sizes = [int(np.prod([dims[d][1] for d in dimids[1:]], dtype=np.int64)) * dtype.itemsize
+                      for (_, dimids, _, dtype, _), record in zip(specs, is_record) if record]
+        record_size = slab_sizes[0] if len(slab_sizes) == 1 else sum(_padded(n) for n in slab_sizes)
+        if numrecs == STREAMING:
+            first = min((begin for (_, _, _, _, begin), record in zip(specs, is_record) if record), default=size)
+            numrecs = (size - first) // record_size if record_size else 0
+        self.dimensions = {name: (numrecs if k == record_dim else length)
+                           for k, (name, length) in enumerate(dims)}
+
+        self.variables = {}
+        for (name, dimids, attrs, dtype, begin), record in zip(specs, is_record):
+            shape = tuple(self.dimensions[dims[d][0]] for d in dimids)
+            strides = tuple(int(np.prod(shape[k + 1:], dtype=np.int64)) * dtype.itemsize
+                            for k in range(len(shape)))
+            if record:
+                strides = (record_size,) + strides[1:]
+            data = np.ndarray(shape, dtype=dtype, buffer=mm, offset=begin, strides=strides)
+            self.variables[name] = MmapVariable(name, tuple(dims[d][0] for d in dimids), data, attrs)
+
+    def ncattrs(self):
+        return list(self.attrs)
+
+    def __getattr__(self, name):
+        attrs = self.__dict__.get('attrs', {})
+        if name in attrs:
+            return attrs[name]
+        raise AttributeError(name)
+
+    def close(self):
+        # The mapping itself is released once no slice taken from it is alive
+        self.variables = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,80 @@
+import numpy as np
+from fill_values import read_nan
+
+# Bay of Bengal region used by the seasonal plots: 5N–30N, 75E–100E
+BAY_OF_BENGAL = {'lat': (5, 30), 'lon': (75, 100)}
+
+
+# Reader backends: netCDF4, or memory-mapped views of the classic-format files (nc3_mmap)
+BACKENDS = ('netcdf4', 'mmap')
+# The scripts' --backend help. The mmap views still go through fill_values.to_nan,
+# which copies the big-endian data into native float32 blocks.
+BACKEND_HELP = ('NetCDF reader: netcdf4, or mmap to read classic-format files through a memory map '
+                '(default: netcdf4)')
+
+
+def year_path(year):
+    return f'Year_{year}/year_{year}_combined.nc'
+
+
+def year_source(year, store=None):
+    # Where a year's data lives: its Year_N file, or (store, N) inside a chunked store
+    if store:
+        return (store, int(year))
+    return year_path(year)
+
+
+def open_dataset(path, backend='netcdf4'):
+    # `path` may also be a (store, N) source from year_source; backend then doesn't apply
+    if isinstance(path, tuple):
+        from chunked_store import ChunkedStore
+        store, year = path
+        return ChunkedStore(store).year(year)
+    if backend == 'mmap':
+        from nc3_mmap import MmapDataset
+        return MmapDataset(path)
+    if backend != 'netcdf4':
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}.")
+    from netCDF4 import Dataset
+    return Dataset(path)
+
+
+def index_span(coord, lo, hi):
+    # Contiguous index slice covering lo <= coord <= hi (coord is monotonic)
+    indices = np.flatnonzero((coord >= lo) & (coord <= hi))
+    if indices.size == 0:
+        raise ValueError(f"No grid points between {lo} and {hi}.")
+    return slice(int(indices[0]), int(indices[-1]) + 1)
+
+
+def region_slices(lat, lon, region):
+    # Turn a {'lat': (lo, hi), 'lon': (lo, hi)} bounding box into hyperslab slices
+    lat_slice = index_span(np.asarray(lat), *region['lat'])
+    lon_slice = index_span(np.asarray(lon), *region['lon'])
+    return lat_slice, lon_slice
+
+
+def day_runs(days):
+    # Split a day selection into (start, stop) runs of consecutive indices, keeping its order
+    days = np.asarray(days, dtype=np.intp)
+    if days.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(days) != 1) + 1
+    starts = np.r_[0, breaks]
+    stops = np.r_[breaks, days.size]
+    return [(int(days[a]), int(days[b - 1]) + 1) for a, b in zip(starts, stops)]
+
+
+def read_region(var, days=None, lat_slice=slice(None), lon_slice=slice(None)):
+    # Read only the requested days and region of a (time, lat, lon) variable, as a
+    # float32 ndarray with NaN for missing cells (see fill_values).
+    # `days` may be None (all days), a single index, a slice or a sequence of indices;
+    # sequences are read as one contiguous hyperslab per run of consecutive days.
+    if days is None:
+        return read_nan(var, (slice(None), lat_slice, lon_slice))
+    if isinstance(days, (int, np.integer, slice)):
+        return read_nan(var, (days, lat_slice, lon_slice))
+    blocks = [read_nan(var, (slice(start, stop), lat_slice, lon_slice)) for start, stop in day_runs(days)]
+    if len(blocks) == 1:
+        return blocks[0]
+    return np.concatenate(blocks, axis=0)
@@ -0,0 +1,302 @@
+import csv
+import argparse
+import importlib.util
+import numpy as np
+from clim_cache import CACHE_DIR, ClimCache
+from fill_values import nan_mean, to_masked
+from nc_region import BACKEND_HELP, BACKENDS, year_source, open_dataset, read_region
+from prefetch import nc_lock, prefetch
+from regions import DEFAULT_REGION, cache_spec, load_regions, make_region, select_regions
+from season_products import full_year_name, get_region_index, load_season_fields, log_entry
+from season_reducer import SEASON_DAYS, grouped_sums, season_index
+from static_mask import region_mask
+from window_means import monthly_windows, load_window_products
+import stage_timer
+from stage_timer import timer
+
+# Render-free data products of the season and 30-day window plots. The same reduced
+# fields the figures are drawn from (through the same caches) go to one NetCDF file,
+# and summary statistics per year, period, region and field to a tidy CSV or Parquet
+# table. Nothing here imports matplotlib or cartopy.
+#
+#   season/<region>   (year, season, lat, lon)  what plot_vector_scalar.py draws per region
+#   window            (year, window, lat, lon)  what plot_vector_scalar_yearwise.py draws
+#
+# U/V keep the plots' scaling (un, vn / 100 for seasons, / 10 for windows) and P is
+# pn / 980 (hPa). Missing cells are _FillValue in the file and skipped by the stats;
+# the season magnitude min/max are the variation log's numbers.
+#
+#   python numeric_export.py 11 12 13 --regions bay_of_bengal arabian_sea
+#   python plot_vector_scalar.py --no-render          # same, seasons only, plus the variation log
+
+PERIODS = ('season', 'window')
+FIELDS = ('U', 'V', 'P', 'speed', 'magnitude', 'direction')
+SCALES = {
+    'season': {'U': 'un / 100', 'V': 'vn / 100', 'P': 'pn / 980'},
+    'window': {'U': 'un / 10', 'V': 'vn / 10', 'P': 'pn / 980'},
+}
+PRESSURE_SCALE = 980
+COLUMNS = ('year', 'period_type', 'period', 'region', 'variable', 'count', 'min', 'max', 'mean', 'std')
+
+
+def export_prefix(timestamp=None):
+    # Same timestamp format as the variation_log_*.txt names
+    return f"numeric_export_{timestamp or stage_timer.timestamp()}"
+
+
+def season_pressure(ncfile, ds, index, cache=None):
+    # {region: {season: P}} season means of pn in hPa, read and reduced once over the
+    # regions still missing from the cache, like the U/V means
+    keys = {}
+    region_fields = {}
+    missing = list(index.regions)
+    if cache is not None:
+        missing = []
+        for name, region in index.regions.items():
+            keys[name] = {season: cache.key(ncfile, 'pn', cache_spec(region), days, scale=PRESSURE_SCALE)
+                          for season, days in SEASON_DAYS.items()}
+            with timer.stage('cache_load', region=name):
+                cached = {season: cache.load(key) for season, key in keys[name].items()}
+            if all(fields is not None for fields in cached.values()):
+                region_fields[name] = {season: fields['P'] for season, fields in cached.items()}
+            else:
+                missing.append(name)
+        if not missing:
+            return region_fields
+
+    bounds = index.bounds(missing)
+    with timer.stage('static_mask'):
+        mask = region_mask(ncfile, ds, *bounds)
+    with timer.stage('read'):
+        pn = read_region(ds.variables['pn'], None, *bounds)
+        if mask is not None:
+            pn = mask.pack(pn)
+    with timer.stage('reduce'):
+        sums, counts = grouped_sums(pn, season_index(pn.shape[0]), len(SEASON_DAYS))
+        if mask is not None:
+            sums, counts = mask.unpack(sums, 0), mask.unpack(counts, 0)
+    for name in missing:
+        region_fields[name] = {}
+        for k, season in enumerate(SEASON_DAYS):
+            P = index.cut(name, nan_mean(sums[k], counts[k], PRESSURE_SCALE), bounds)
+            region_fields[name][season] = P
+            if cache is not None:
+                cache.store(keys[name][season], {'P': P})
+    return region_fields
+
+
+def window_fields(fields):
+    # The yearwise plot's window products in its units (U/V in dm/s, P in hPa)
+    return {'U': fields['U'].astype(np.float64) / 10, 'V': fields['V'].astype(np.float64) / 10,
+            'P': fields['P'].astype(np.float64) / PRESSURE_SCALE, 'speed': fields['speed'],
+            'magnitude': fields['magnitude'], 'direction': fields['direction']}
+
+
+def load_products(year, periods=PERIODS, cache=None, backend='netcdf4', store=None, regions=None,
+                  windows=None):
+    # Everything one year contributes, from a single open of its file
+    year_full = full_year_name(str(year))
+    ncfile = year_source(year, store)
+    products = {'year': year_full}
+    with timer.context(year=year_full), timer.stage('load'):
+        with open_dataset(ncfile, backend) as ds:
+            lat = np.asarray(ds.variables['lat'][:])
+            lon = np.asarray(ds.variables['lon'][:])
+            if 'season' in periods:
+                index = get_region_index(lat, lon, regions or select_regions([DEFAULT_REGION]))
+                uv = load_season_fields(ncfile, ds, index, cache)
+                pressure = season_pressure(ncfile, ds, index, cache)
+                products['season'] = (index, {
+                    name: {season: {'P': pressure[name][season],
+                                    **{field: uv[name][season][field] for field in FIELDS if field != 'P'}}
+                           for season in SEASON_DAYS}
+                    for name in index.regions})
+            if 'window' in periods:
+                windows = windows or monthly_windows()
+                means = load_window_products(ncfile, ds, windows, cache)
+                products['window'] = (lat, lon, windows, [window_fields(fields) for fields in means])
+    print(f"Reduced Year: {year_full}")
+    return products
+
+
+def field_stats(field):
+    valid = np.asarray(field, dtype=np.float64)
+    valid = valid[np.isfinite(valid)]
+    if valid.size == 0:
+        return {'count': 0, 'min': np.nan, 'max': np.nan, 'mean': np.nan, 'std': np.nan}
+    return {'count': int(valid.size), 'min': float(valid.min()), 'max': float(valid.max()),
+            'mean': float(valid.mean()), 'std': float(valid.std())}
+
+
+class NumericExport:
+    # One NetCDF file appended a year at a time, plus the rows of the stats table.
+    # The years are read on a prefetch thread while this file is written, so every
+    # write and the close hold prefetch.nc_lock (netCDF-C is not thread-safe).
+    def __init__(self, path):
+        from netCDF4 import Dataset
+
+        self.path = path
+        self.ds = Dataset(path, 'w')
+        self.ds.fields = ','.join(FIELDS)
+        self.groups = {}
+        self.rows = []
+
+    def _group(self, path, period_type, periods, lat, lon):
+        # Group with dims (year, <period_type>, lat, lon), created on first use
+        if path in self.groups:
+            return self.groups[path]
+        group = self.groups[path] = self.ds.createGroup(path)
+        group.createDimension('year', None)
+        group.createDimension(period_type, len(periods))
+        group.createDimension('lat', len(lat))
+        group.createDimension('lon', len(lon))
+        group.createVariable('year', 'i4', ('year',))
+        group.createVariable('lat', 'f8', ('lat',))[:] = lat
+        group.createVariable('lon', 'f8', ('lon',))[:] = lon
+        if period_type == 'season':
+            group.season_names = ','.join(periods)
+        else:
+            group.createVariable('day_init', 'i4', ('window',))[:] = [a for a, _ in periods]
+            group.createVariable('day_final', 'i4', ('window',))[:] = [b for _, b in periods]
+        for field in FIELDS:
+            var = group.createVariable(field, 'f4', ('year', period_type, 'lat', 'lon'),
+                                       zlib=True, fill_value=np.float32(9.969e+36))
+            if field in SCALES[period_type]:
+                var.source = SCALES[period_type][field]
+        return group
+
+    def add(self, year_full, period_type, region, periods, lat, lon, fields):
+        # fields: one {field: (lat, lon) array} per period
+        path = f'season/{region}' if period_type == 'season' else 'window'
+        with nc_lock:
+            group = self._group(path, period_type, periods, lat, lon)
+            k = len(group.variables['year'])
+            group.variables['year'][k] = int(year_full)
+            for field in FIELDS:
+                group.variables[field][k] = to_masked(np.stack([period[field] for period in fields]))
+        for period, period_fields in zip(periods, fields):
+            label = period if period_type == 'season' else f'{period[0]}-{period[1]}'
+            for field in FIELDS:
+                self.rows.append({'year': int(year_full), 'period_type': period_type, 'period': label,
+                                  'region': region, 'variable': field, **field_stats(period_fields[field])})
+
+    def close(self):
+        with nc_lock:
+            self.ds.close()
+
+
+def write_table(rows, path):
+    # CSV, or Parquet (needs pandas with pyarrow or fastparquet) for a .parquet path
+    if path.endswith('.parquet'):
+        try:
+            import pandas as pd
+        except ImportError:
+            raise RuntimeError("Parquet output needs pandas (with pyarrow or fastparquet); "
+                               "use --table-format csv instead.")
+        pd.DataFrame(rows, columns=COLUMNS).to_parquet(path, index=False)
+        return path
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def export_years(years, prefix=None, periods=PERIODS, cache=None, backend='netcdf4', store=None,
+                 regions=None, windows=None, read_ahead=1, table_format='csv'):
+    # Writes <prefix>.nc and <prefix>.<table_format>; returns their paths and the
+    # variation log dict ({year: {entry: {'min_magnitude', 'max_magnitude'}}}) of the seasons
+    prefix = prefix or export_prefix()
+    export = NumericExport(f'{prefix}.nc')
+    export.ds.years = ','.join(str(year) for year in years)  # before the prefetch thread starts
+    dict_data = {}
+    try:
+        loads = (load_products(year, periods, cache, backend, store, regions, windows) for year in years)
+        for products in prefetch(loads, read_ahead, name='load_products'):
+            year_full = products['year']
+            with timer.stage('export', year=year_full):
+                if 'season' in products:
+                    index, region_fields = products['season']
+                    dict_data[year_full] = {}
+                    for name, region in index.regions.items():
+                        lat_sub, lon_sub = index.coords(name)
+                        seasons = list(SEASON_DAYS)
+                        export.add(year_full, 'season', name, seasons, lat_sub, lon_sub,
+                                   [region_fields[name][season] for season in seasons])
+                        for season in seasons:
+                            magnitude = region_fields[name][season]['magnitude']
+                            dict_data[year_full][log_entry(season, name, region['label'])] = {
+                                'min_magnitude': float(np.nanmin(magnitude)),
+                                'max_magnitude': float(np.nanmax(magnitude)),
+                            }
+                if 'window' in products:
+                    lat, lon, year_windows, fields = products['window']
+                    export.add(year_full, 'window', 'full_domain', year_windows, lat, lon, fields)
+    finally:
+        export.close()
+    table = write_table(export.rows, f'{prefix}.{table_format}')
+    print(f"Fields written to: {export.path}")
+    print(f"Statistics written to: {table}")
+    return export.path, table, dict_data
+
+
+def add_arguments(parser):
+    # Output options, shared with the plot scripts' --no-render mode (which pass an
+    # argument group of the parser)
+    parser.add_argument('--export-prefix', default=None,
+                        help='Output path without extension (default: numeric_export_<timestamp>)')
+    parser.add_argument('--table-format', choices=['csv', 'parquet'], default='csv',
+                        help='Statistics table format (default: csv; parquet needs pandas)')
+
+
+def check_arguments(parser, args):
+    # Parquet support is checked when the arguments are parsed, not after every year
+    # has been reduced and the .nc written
+    if args.table_format == 'parquet' and not (
+            importlib.util.find_spec('pandas')
+            and (importlib.util.find_spec('pyarrow') or importlib.util.find_spec('fastparquet'))):
+        parser.error("--table-format parquet needs pandas with pyarrow or fastparquet; "
+                     "use --table-format csv instead")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Season and 30-day window fields and statistics, without rendering.')
+    parser.add_argument('years', nargs='*', default=[str(year) for year in range(11, 23)],
+                        help='Year numbers to process (default: 11 to 22)')
+    parser.add_argument('--periods', nargs='+', choices=PERIODS, default=list(PERIODS),
+                        help='Season means per region and/or the monthly full-domain windows (default: both)')
+    parser.add_argument('--regions', nargs='+', default=[DEFAULT_REGION],
+                        help=f'Regions of the season products (default: {DEFAULT_REGION})')
+    parser.add_argument('--region-file', default=None,
+                        help='JSON file of user-defined regions (lat/lon boxes or lon/lat polygons)')
+    parser.add_argument('--box', nargs=5, action='append', default=[],
+                        metavar=('NAME', 'LAT0', 'LAT1', 'LON0', 'LON1'),
+                        help='Define a box region NAME (repeatable); list it in --regions to export it')
+    add_arguments(parser)
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help=f'Directory for cached season and window means (default: {CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true', help='Always recompute the means from the NetCDF files')
+    parser.add_argument('--backend', choices=BACKENDS, default='netcdf4',
+                        help=BACKEND_HELP)
+    parser.add_argument('--store', default=None,
+                        help='Read the years from this chunked store (see chunked_store.py)')
+    parser.add_argument('--read-ahead', type=int, default=1,
+                        help='Years read and reduced on a background thread ahead of writing (default: 1)')
+    parser.add_argument('--timings', action='store_true',
+                        help='Write per-stage wall/CPU/RSS records to stage_timings_<timestamp>.jsonl')
+    args = parser.parse_args()
+    check_arguments(parser, args)
+
+    extra = load_regions(args.region_file) if args.region_file else {}
+    for name, lat0, lat1, lon0, lon1 in args.box:
+        extra[name] = make_region(name, lat=(lat0, lat1), lon=(lon0, lon1))
+    try:
+        regions = select_regions(args.regions, extra)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    timestamp = stage_timer.timestamp()
+    stage_timer.configure(stage_timer.timings_path(timestamp) if args.timings else None)
+    cache = None if args.no_cache else ClimCache(args.cache_dir)
+    export_years(args.years, args.export_prefix or export_prefix(timestamp), args.periods, cache,
+                 args.backend, args.store, regions, read_ahead=args.read_ahead, table_format=args.table_format)
@@ -1,145 +1,137 @@
-import sys
+import argparse
 import numpy as np
-from netCDF4 import Dataset
-import matplotlib.pyplot as plt
 import os
-import datetime
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
+from concurrent.futures import ProcessPoolExecutor
+from clim_cache import CACHE_DIR, ClimCache
+import numeric_export
+from derived_fields import QUIVER_STEP
+from nc_region import BACKEND_HELP, BACKENDS, year_source, open_dataset
+from prefetch import prefetch
+from regions import DEFAULT_REGION, load_regions, make_region, select_regions
+from season_products import full_year_name, get_region_index, load_season_fields, log_entry
+from season_reducer import SEASON_DAYS
+import stage_timer
+from stage_timer import timer
 
 dict_data = {}
 
-def generate_season_wise_plots_updated(year):
+# One map template per region, each reused for every season and year on its grid
+_season_frames = {}
+
+def get_season_frame(region, lon_sub, lat_sub, magnitude, quiver_U, quiver_V, title, extent):
+    # quiver_U / quiver_V are the precomputed arrows (every QUIVER_STEP-th cell).
+    # matplotlib and cartopy load with the first frame, so --no-render never imports them.
+    from map_frame import season_frame
+
+    frame = _season_frames.get(region)
+    if frame is not None and frame.matches(lon_sub, lat_sub):
+        frame.update(magnitude, quiver_U, quiver_V, title, decimated=True)
+    else:
+        if frame is not None:
+            frame.close()
+        frame = _season_frames[region] = season_frame(lon_sub, lat_sub, magnitude, quiver_U, quiver_V, title,
+                                                      step=QUIVER_STEP, extent=extent, decimated=True)
+    return frame
+
+def generate_season_wise_plots_updated(year, cache=None, backend='netcdf4', store=None, regions=None):
+    year_full = full_year_name(year)
+    with timer.stage('year', year=year_full):
+        index, region_fields = load_year(year, cache, backend, store, regions)
+        plot_year(year_full, index, region_fields)
+    return year_full, dict_data[year_full]
+
+def load_year(year, cache=None, backend='netcdf4', store=None, regions=None):
+    # Everything before rendering: open the year, read and reduce its regions, close it.
+    # May run on the prefetch thread, so it sets its own year label.
     print(f"Processing data for Year: {year}")
-    ncfile = f'Year_{year}/year_{year}_combined.nc'
+    ncfile = year_source(year, store)
+    year_full = full_year_name(year)
     print(f"Reading NetCDF file: {ncfile}")
-    ds = Dataset(ncfile)
-    if len(year) == 1:
-        year_full = '200' + year
-    else:
-        year_full = '20' + year
-    dict_data[year_full] = {}
-
-    lon = ds.variables['lon'][:]
-    lat = ds.variables['lat'][:]
-    un = ds.variables['un'][:]
-    vn = ds.variables['vn'][:]
-
-    # Find indices for the region: 5N–30N, 75E–100E
-    lat_mask = (lat >= 5) & (lat <= 30)
-    lon_mask = (lon >= 75) & (lon <= 100)
-    lat_indices = np.where(lat_mask)[0]
-    lon_indices = np.where(lon_mask)[0]
-
-    # Subset the lat/lon arrays
-    lat_sub = lat[lat_indices]
-    lon_sub = lon[lon_indices]
-
-    # Define seasons with day indices
-    seasons = {
-        'Winter': list(range(334, 365)) + list(range(0, 31)) + list(range(31, 60)),
-        'Summer': list(range(60, 91)) + list(range(91, 121)) + list(range(121, 152)),
-        'Spring': list(range(152, 182)) + list(range(182, 213)) + list(range(213, 243)),
-        'Autumn': list(range(243, 274)) + list(range(274, 304)) + list(range(304, 334))
-    }
-
-    for season, days in seasons.items():
-        output_dir = f'Image_output/{season}'
-        os.makedirs(output_dir, exist_ok=True)
-        dict_data[year_full][season] = {}
-
-        # Stack all U and V for this season, then average
-        U_stack = []
-        V_stack = []
-        for time_idx in days:
-            U = un[time_idx, :, :]
-            V = vn[time_idx, :, :]
-            # Subset to region
-            U = U[np.ix_(lat_indices, lon_indices)]
-            V = V[np.ix_(lat_indices, lon_indices)]
-            U = np.ma.masked_where(U >= 1e+30, U)
-            V = np.ma.masked_where(V >= 1e+30, V)
-            U = U / 100  # convert to dm/s
-            V = V / 100
-            U_stack.append(U)
-            V_stack.append(V)
-
-        U_season = np.ma.mean(np.ma.stack(U_stack), axis=0)
-        V_season = np.ma.mean(np.ma.stack(V_stack), axis=0)
-
-        # Mask invalid values before magnitude calculation to avoid warnings
-        U_season = np.ma.masked_invalid(U_season)
-        V_season = np.ma.masked_invalid(V_season)
-
-        magnitude = np.ma.sqrt(U_season**2 + V_season**2) * np.sign(U_season) * np.sign(V_season)
-        # No multiplication! Plot as is.
-
-        # Print min and max magnitude (ignoring masked values)
-        min_mag = float(magnitude.min())
-        max_mag = float(magnitude.max())
-        dict_data[year_full][season]['min_magnitude'] = min_mag
-        dict_data[year_full][season]['max_magnitude'] = max_mag
-        print(f"Season: {season}, Min Magnitude: {min_mag:.4f}, Max Magnitude: {max_mag:.4f}")
-
-        # Prepare custom colormap with over/under colors for out-of-bounds
-        cmap = plt.get_cmap('RdBu_r').copy()
-        light_grey = '#D3D3D3'
-        cmap.set_over(light_grey)
-        cmap.set_under(light_grey)
-
-        LON, LAT = np.meshgrid(lon_sub, lat_sub)
-        scale_val = 30
-
-        plt.figure(figsize=(10, 8))
-        ax = plt.axes(projection=ccrs.PlateCarree())
-        pc = ax.pcolormesh(LON, LAT, magnitude, cmap=cmap, shading='gouraud',
-                           vmin=-0.3, vmax=0.3, transform=ccrs.PlateCarree())
-        plt.colorbar(pc, label='Wind Vector Magnitude (cm/s)', extend='both', ax=ax)
-        step = 8
-        ax.quiver(LON[::step, ::step], LAT[::step, ::step], U_season[::step, ::step], V_season[::step, ::step], 
-                  scale=scale_val, color='k', width=0.002, headwidth=3, transform=ccrs.PlateCarree())
-        # Add bold landlines and coastlines with white landmass
-        ax.add_feature(cfeature.LAND, facecolor='white', edgecolor='black', linewidth=1.5)
-        ax.coastlines(linewidth=1.5)
-        # Set extent to Bay of Bengal region
-        ax.set_extent([75, 100, 5, 30], crs=ccrs.PlateCarree())
-
-        # Add gridlines with labels
-        gl = ax.gridlines(draw_labels=True, linewidth=1.2, color='gray', alpha=0.7, linestyle='--')
-        gl.top_labels = False
-        gl.right_labels = False
-        gl.xlabel_style = {'size': 12, 'weight': 'bold'}
-        gl.ylabel_style = {'size': 12, 'weight': 'bold'}
-
-        # Add note about the color mapping and scaling
-        '''plt.text(0.5, 0.02, 
-            'Magnitude plotted between 0–0.3 cm/s;\n'
-            'Values outside (0,0.3) are shown as light grey.\n',
-            ha='center', va='center', transform=plt.gcf().transFigure, fontsize=10, color='black', bbox=dict(facecolor='white', alpha=0.7, edgecolor='none'))
-        '''
-        plt.xlabel('Longitude')
-        plt.ylabel('Latitude')
-        plt.title(f'Satellite : {season} {year_full} (Bay of Bengal)', fontsize=14)
-        plt.tight_layout()
-
-        filename = f'{output_dir}/{season}-{year_full}.png'
-        plt.savefig(filename, dpi=200)
-        plt.close()
-        print(f"Saved plot: {filename}")
-    
-    ds.close()
+    with timer.context(year=year_full):
+        with timer.stage('open'):
+            ds = open_dataset(ncfile, backend)
+            lon = ds.variables['lon'][:]
+            lat = ds.variables['lat'][:]
+
+        # Read only the hyperslab covering the regions (by default the Bay of Bengal,
+        # 5N–30N, 75E–100E) so every season of every region comes from that one pass
+        regions = regions or select_regions([DEFAULT_REGION])
+        index = get_region_index(lat, lon, regions)
+        region_fields = load_season_fields(ncfile, ds, index, cache)
+        ds.close()
     print(f"Closed dataset for Year: {year_full}")
+    return index, region_fields
 
-if __name__ == '__main__':
-    for year in range(11, 23):
-        generate_season_wise_plots_updated(str(year))
-        print(f"Completed processing for Year: 20{year:02d}")
-    """if len(sys.argv) > 1:
-        year_arg = sys.argv[1]
+def plot_year(year_full, index, region_fields):
+    dict_data[year_full] = {}
+    for name, region in index.regions.items():
+        lat_sub, lon_sub = index.coords(name)
+        for season in SEASON_DAYS:
+            with timer.stage('season', season=season, region=name):
+                plot_season(season, region_fields[name][season], lon_sub, lat_sub, year_full,
+                            name, region['label'], index.extent(name))
+
+def plot_season(season, fields, lon_sub, lat_sub, year_full, region=DEFAULT_REGION, label='Bay of Bengal',
+                extent=(75, 100, 5, 30)):
+    # The Bay of Bengal keeps the Image_output/{season} layout the season grids read;
+    # other regions get their own Image_output/{region}/{season} folders and log entries
+    if region == DEFAULT_REGION:
+        output_dir = f'Image_output/{season}'
+    else:
+        output_dir = f'Image_output/{region}/{season}'
+    entry = log_entry(season, region, label)
+    os.makedirs(output_dir, exist_ok=True)
+    dict_data[year_full][entry] = {}
+
+    # Colour field and arrows come precomputed with the season means (derived_fields)
+    magnitude = fields['magnitude']
+    # No multiplication! Plot as is.
+
+    # Print min and max magnitude (ignoring missing values)
+    min_mag = float(fields['min_magnitude'])
+    max_mag = float(fields['max_magnitude'])
+    dict_data[year_full][entry]['min_magnitude'] = min_mag
+    dict_data[year_full][entry]['max_magnitude'] = max_mag
+    print(f"Season: {entry}, Min Magnitude: {min_mag:.4f}, Max Magnitude: {max_mag:.4f}")
+
+    # The map template is built once per process and region and reused for every season
+    # and year on the same grid; only the mesh data, arrows and title change per image.
+    title = f'Satellite : {season} {year_full} ({label})'
+    with timer.stage('frame'):
+        frame = get_season_frame(region, lon_sub, lat_sub, magnitude, fields['quiver_U'], fields['quiver_V'],
+                                 title, extent)
+
+    filename = f'{output_dir}/{season}-{year_full}.png'
+    frame.save(filename, dpi=200)
+    print(f"Saved plot: {filename}")
+
+def run_years(years, workers=1, cache=None, timings=None, profile_dir=None, backend='netcdf4', store=None,
+              regions=None, read_ahead=1):
+    # Each year is independent: fan years out to a process pool and merge the
+    # per-season min/max dicts back in year order so the variation log is unchanged.
+    years = [str(year) for year in years]
+    if workers <= 1:
+        # In a single process the next `read_ahead` years are read and reduced on a
+        # background thread while the current one renders
+        loads = ((year, load_year(year, cache, backend, store, regions)) for year in years)
+        results = []
+        for year, (index, region_fields) in prefetch(loads, read_ahead, name='load_year'):
+            year_full = full_year_name(year)
+            with timer.stage('year', year=year_full):
+                plot_year(year_full, index, region_fields)
+            results.append((year_full, dict_data[year_full]))
     else:
-        year_arg = '8'  # Default year if not provided
-    generate_season_wise_plots_updated(year_arg)
-    print("All plots generated successfully.")"""
+        with ProcessPoolExecutor(max_workers=workers, initializer=stage_timer.configure,
+                                 initargs=(timings, profile_dir)) as executor:
+            results = list(executor.map(generate_season_wise_plots_updated, years,
+                                        [cache] * len(years), [backend] * len(years),
+                                        [store] * len(years), [regions] * len(years)))
+    for year_full, seasons in results:
+        dict_data[year_full] = seasons
+        print(f"Completed processing for Year: {year_full}")
+    return dict_data
+
+def write_variation_log(dict_data, timestamp=None):
     # Print average and variation for each year's seasons
     # Collect stats for each season across all years
     season_stats = {}
@@ -172,9 +164,75 @@ if __name__ == '__main__':
         print(line)
 
     # Write to file
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    timestamp = timestamp or stage_timer.timestamp()
     log_filename = f"variation_log_{timestamp}.txt"
     with open(log_filename, "w") as f:
         for line in output_lines:
             f.write(line + "\n")
     print(f"\nVariation log written to: {log_filename}")
+    return log_filename
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Season-wise vector/scalar plots for the Bay of Bengal (or other regions).')
+    parser.add_argument('years', nargs='*', default=[str(year) for year in range(11, 23)],
+                        help='Year numbers to process (default: 11 to 22)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of years processed in parallel (default: 1)')
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help=f'Directory for cached season means (default: {CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always recompute season means from the NetCDF files')
+    parser.add_argument('--backend', choices=BACKENDS, default='netcdf4',
+                        help=BACKEND_HELP)
+    parser.add_argument('--store', default=None,
+                        help='Read the years from this chunked store (see chunked_store.py) '
+                             'instead of the Year_N files')
+    parser.add_argument('--regions', nargs='+', default=[DEFAULT_REGION],
+                        help=f'Regions plotted from one read per year: names from regions.REGIONS, '
+                             f'--region-file or --box (default: {DEFAULT_REGION})')
+    parser.add_argument('--region-file', default=None,
+                        help='JSON file of user-defined regions (lat/lon boxes or lon/lat polygons)')
+    parser.add_argument('--box', nargs=5, action='append', default=[],
+                        metavar=('NAME', 'LAT0', 'LAT1', 'LON0', 'LON1'),
+                        help='Define a box region NAME (repeatable); list it in --regions to plot it')
+    parser.add_argument('--read-ahead', type=int, default=1,
+                        help='With --workers 1, years read and reduced on a background thread '
+                             'ahead of rendering (default: 1; 0 reads inline)')
+    parser.add_argument('--no-render', action='store_true',
+                        help='Skip the figures: write the season fields and statistics (numeric_export.py) '
+                             'and the variation log, without importing matplotlib or cartopy')
+    numeric_export.add_arguments(parser.add_argument_group('--no-render output'))
+    parser.add_argument('--timings', action='store_true',
+                        help='Write per-stage wall/CPU/RSS records to stage_timings_<timestamp>.jsonl')
+    parser.add_argument('--profile-dir', default=None,
+                        help='Also dump a cProfile file per process into this directory')
+    args = parser.parse_args()
+    if args.no_render:
+        numeric_export.check_arguments(parser, args)
+
+    extra = load_regions(args.region_file) if args.region_file else {}
+    for name, lat0, lat1, lon0, lon1 in args.box:
+        extra[name] = make_region(name, lat=(lat0, lat1), lon=(lon0, lon1))
+    try:
+        regions = select_regions(args.regions, extra)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    # The timings file shares its timestamp with the variation log
+    timestamp = stage_timer.timestamp()
+    timings = stage_timer.timings_path(timestamp) if args.timings else None
+    stage_timer.configure(timings, args.profile_dir)
+    cache = None if args.no_cache else ClimCache(args.cache_dir)
+    if args.no_render:
+        # Reads and reduces in this process (with read-ahead); --workers only parallelizes rendering
+        prefix = args.export_prefix or numeric_export.export_prefix(timestamp)
+        _, _, exported = numeric_export.export_years(args.years, prefix, ('season',), cache, args.backend,
+                                                     args.store, regions, read_ahead=args.read_ahead,
+                                                     table_format=args.table_format)
+        dict_data.update(exported)
+    else:
+        run_years(args.years, args.workers, cache, timings, args.profile_dir, args.backend, args.store, regions,
+                  args.read_ahead)
+    write_variation_log(dict_data, timestamp)
+    if timings:
+        print(f"Stage timings written to: {timings}")
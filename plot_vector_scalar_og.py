@@ -1,26 +1,19 @@
 import numpy as np
-from netCDF4 import Dataset
-import matplotlib.pyplot as plt
-import sys
-
-year = sys.argv[1] if len(sys.argv) > 1 else '6'  # Default to Year6 if no argument is provided
-print(f"Processing data for Year: {year}")
-# Load the NetCDF file
-ncfile = f'Year_{year}/year_{year}_combined.nc'  # Replace with your actual file
-ds = Dataset(ncfile)
-if len(year) == 1:
-        year = '200' + year  # Ensure year is two digits (e.g., '2006' for Year 6)
-else:
-        year = '20' + year # Ensure year is two digits (e.g., '2023' for Year 23)
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import util
+from clip_utils import RunningQuantiles, mask_percentile
+from fill_values import valid_values
+from nc_region import BACKEND_HELP, BACKENDS, year_source, open_dataset, read_region
+from prefetch import prefetch
+import stage_timer
+from stage_timer import timer
+
+# Each worker process (or the main process when rendering inline) keeps one figure
+_frame = None
 
-# Extract variables
-lon = ds.variables['lon'][:]
-lat = ds.variables['lat'][:]
-un = ds.variables['un'][:]  # shape: (time, lat, lon)
-vn = ds.variables['vn'][:]
-pn = ds.variables['pn'][:]
 
-for time_idx in range(364):
+def day_label(time_idx):
     if time_idx <= 30:
         month = 'Jan'
         day = f"{time_idx+1:02d}"  # Format day as 01, 02, ..., 31
@@ -35,7 +28,7 @@ for time_idx in range(364):
         day = f"{time_idx-90+1:02d}"  # Format day as 01, 02, ..., 30
     elif time_idx <= 151:
         month = 'May'
-        day = f"{time_idx-120+1:02d}"  # Format day as 01, 02, ..., 31               
+        day = f"{time_idx-120+1:02d}"  # Format day as 01, 02, ..., 31
     elif time_idx <= 181:
         month = 'Jun'
         day = f"{time_idx-151+1:02d}"  # Format day as 01, 02, ..., 30
@@ -57,58 +50,188 @@ for time_idx in range(364):
     else:
         month = 'Dec'
         day = f"{time_idx-334+1:02d}"  # Format day as 01, 02, ..., 31
-            
+    return day, month
+
+
+def read_chunks(ds, n_days, chunk=8):
+    # (start, U, V, P) blocks of `chunk` days, one hyperslab per variable
+    un = ds.variables['un']  # shape: (time, lat, lon)
+    vn = ds.variables['vn']
+    pn = ds.variables['pn']
+    for start in range(0, n_days, chunk):
+        window = slice(start, min(start + chunk, n_days))
+        with timer.stage('read', day=start + 1):
+            U_chunk = read_region(un, window)
+            V_chunk = read_region(vn, window)
+            P_chunk = read_region(pn, window)
+        yield start, U_chunk, V_chunk, P_chunk
+
+
+def iter_days(ds, n_days, chunk=8, read_ahead=0):
+    # Stream (time_idx, U, V, P) one day at a time. With read_ahead > 0 up to that many
+    # further chunks are read on a background thread while the current one renders.
+    for start, U_chunk, V_chunk, P_chunk in prefetch(read_chunks(ds, n_days, chunk), read_ahead):
+        for offset in range(U_chunk.shape[0]):
+            yield start + offset, U_chunk[offset], V_chunk[offset], P_chunk[offset]
+
+
+def scale_day(U, V, P):
+    # Fill values (Ferret uses 9.969e+36 as missing) are already NaN from read_region.
+    # The converted fields are float64, like the numpy.ma arithmetic this replaced,
+    # so percentiles and colours are unchanged.
+    P = P.astype(np.float64) / 980  # Convert pressure to hPa
+    U = U.astype(np.float64) / 10  # Convert wind speed to dm/s
+    V = V.astype(np.float64) / 10  # Convert wind speed to dm/s
+    return U, V, P
+
+
+def prepare_day(U, V, P, bounds=None):
+    U, V, P = scale_day(U, V, P)
+    # Mask values outside this day's 1 and 99 percentiles, or outside the given bounds
+    bounds = bounds or {}
+    U = mask_percentile(U, bounds=bounds.get('U'))
+    V = mask_percentile(V, bounds=bounds.get('V'))
+    P = mask_percentile(P, bounds=bounds.get('P'))
+    return U, V, P
+
+
+def clip_bounds(days, running=None):
+    # Running quantiles must see the days in order, so their bounds are accumulated
+    # here in the reading process; the masking itself runs with the render
+    for time_idx, U, V, P in days:
+        bounds = None
+        if running is not None:
+            with timer.stage('quantiles', day=time_idx + 1):
+                fields = dict(zip(('U', 'V', 'P'), scale_day(U, V, P)))
+                bounds = {name: running[name].update(valid_values(field)).bounds()
+                          for name, field in fields.items()}
+        yield time_idx, U, V, P, bounds
+
+
+def mask_and_render(lon, lat, year, time_idx, U, V, P, bounds=None):
+    with timer.context(year=year), timer.stage('mask', day=time_idx + 1):
+        U, V, P = prepare_day(U, V, P, bounds)
+    return render_day(lon, lat, year, time_idx, U, V, P)
+
+
+def render_day(lon, lat, year, time_idx, U, V, P):
+    # matplotlib loads with the first frame, not at startup
+    from map_frame import daily_frame
+
+    global _frame
+    day, month = day_label(time_idx)
     date = f"{time_idx+1:03d}"  # Format day as 001, 002, ..., 365
-    # Choose the time index to plot (e.g., first time slice)
-    U = un[time_idx, :, :]
-    V = vn[time_idx, :, :]
-    P = pn[time_idx, :, :]
-
-    # Mask fill values (Ferret uses 9.969e+36 as missing)
-    fill_value = 9.969e+36
-    # Mask fill values (Ferret uses 9.969e+36 as missing)
-    U = np.ma.masked_where(U >= 1e+30, U)
-    V = np.ma.masked_where(V >= 1e+30, V)
-    P = np.ma.masked_where(P >= 1e+30, P)
-
-    # Mask values outside 1 and 99 percentiles
-    def mask_percentile(arr):
-        valid = arr.compressed()
-        p1, p99 = np.percentile(valid, 1), np.percentile(valid, 99)
-        return np.ma.masked_outside(arr, p1, p99)
-
-    P = P / 980  # Convert pressure to hPa
-    U = U / 10  # Convert wind speed to dm/s
-    V = V / 10  # Convert wind speed to dm/s
-    # Create meshgrid for plotting
-    U = mask_percentile(U)
-    V = mask_percentile(V)
-    P = mask_percentile(P)
-    LON, LAT = np.meshgrid(lon, lat)
-    
-    # Adding a reference text for constant vector magnitude
-    scale_val = 100
-    constant_magnitude = scale_val / 5  # Adjust divisor as needed for your reference
-
-    # Plot
-    plt.figure(figsize=(10, 8))
-    cmap = plt.get_cmap('RdBu_r')  # Choose a colormap
-    pc = plt.pcolormesh(LON, LAT, P, cmap=cmap, shading='auto', vmin=-30, vmax=30)
-    plt.colorbar(pc, label='pn')
-
-    # Quiver (vector field)
-    # To avoid clutter, plot every Nth arrow
-    step = 8
-    plt.quiver(LON[::step, ::step], LAT[::step, ::step], U[::step, ::step], V[::step, ::step], 
-            scale=scale_val, color='k', width=0.002, headwidth=3)
-    # Add the reference text at the bottom of the image
-    plt.text(0.5, 0.02, f'Constant vector magnitude reference: {constant_magnitude:.1f} cm/s', 
-         ha='center', va='center', transform=plt.gcf().transFigure, fontsize=10, color='black')
-    
-    plt.xlabel('Longitude')
-    plt.ylabel('Latitude')
-    plt.title('{} - {} - {}'.format(day,month,year))
-    plt.tight_layout()
-    plt.savefig(f'daily_sat_plots/Year_{year}_day_{date}.png', dpi=200)
-    plt.close()
-    print(f"Year {year} : day {date}.")
+
+    # The figure is built on the first day and reused; later days only swap
+    # the pcolormesh data, the quiver UVs and the title.
+    title = '{} - {} - {}'.format(day, month, year)
+    with timer.context(year=year, day=time_idx + 1):
+        with timer.stage('frame'):
+            if _frame is None:
+                _frame = daily_frame(lon, lat, P, U, V, title)
+            else:
+                _frame.update(P, U, V, title)
+        _frame.save(f'daily_sat_plots/Year_{year}_day_{date}.png', dpi=200)
+    return date
+
+
+def close_frame():
+    global _frame
+    if _frame is not None:
+        _frame.close()
+        _frame = None
+
+
+def init_worker(timings=None, profile_dir=None):
+    # Pool initializer: the worker's figure is closed when the worker exits
+    stage_timer.configure(timings, profile_dir)
+    util.Finalize(None, close_frame, exitpriority=20)
+
+
+def render_year(ds, year, n_days, workers=1, chunk=8, queue_depth=None, clip='exact',
+                timings=None, profile_dir=None, read_ahead=1):
+    # Days are read through a generator and handed to a worker pool; at most
+    # `queue_depth` days are in flight, so memory stays flat whatever n_days is.
+    # Each day is masked where it is rendered (in the workers).
+    lon = ds.variables['lon'][:]
+    lat = ds.variables['lat'][:]
+    running = None
+    if clip == 'running':
+        running = {name: RunningQuantiles((1, 99)) for name in ('U', 'V', 'P')}
+    days = clip_bounds(iter_days(ds, n_days, chunk, read_ahead), running)
+
+    if workers <= 1:
+        for time_idx, U, V, P, bounds in days:
+            date = mask_and_render(lon, lat, year, time_idx, U, V, P, bounds)
+            print(f"Year {year} : day {date}.")
+        close_frame()
+        return
+
+    queue_depth = queue_depth or 2 * workers
+    pending = set()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(timings, profile_dir)) as executor:
+        for time_idx, U, V, P, bounds in days:
+            if len(pending) >= queue_depth:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    print(f"Year {year} : day {future.result()}.")
+            pending.add(executor.submit(mask_and_render, lon, lat, year, time_idx, U, V, P, bounds))
+        for future in wait(pending).done:
+            print(f"Year {year} : day {future.result()}.")
+
+
+def run_year(year, store=None, backend='netcdf4', workers=1, chunk=8, queue_depth=None, clip='exact',
+             timings=None, profile_dir=None, read_ahead=1):
+    print(f"Processing data for Year: {year}")
+    # Load the NetCDF file
+    ncfile = year_source(year, store)
+    ds = open_dataset(ncfile, backend)
+    if len(year) == 1:
+        year = '200' + year  # Ensure year is two digits (e.g., '2006' for Year 6)
+    else:
+        year = '20' + year  # Ensure year is two digits (e.g., '2023' for Year 23)
+
+    n_days = min(364, ds.variables['un'].shape[0])
+    with timer.stage('year', year=year):
+        render_year(ds, year, n_days, workers, chunk, queue_depth, clip, timings, profile_dir, read_ahead)
+    ds.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Daily vector/scalar plots for one year.')
+    parser.add_argument('year', nargs='?', default='6',
+                        help='Year number to process (default: 6)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Render/encode PNGs in this many worker processes (default: 1, inline)')
+    parser.add_argument('--chunk', type=int, default=8,
+                        help='Number of days read per NetCDF hyperslab (default: 8)')
+    parser.add_argument('--queue-depth', type=int, default=None,
+                        help='Maximum days waiting for a worker (default: 2 x workers)')
+    parser.add_argument('--read-ahead', type=int, default=1,
+                        help='Day chunks read on a background thread ahead of rendering '
+                             '(default: 1; 0 reads inline)')
+    parser.add_argument('--clip', choices=['exact', 'running'], default='exact',
+                        help='Clip at each day\'s exact 1/99 percentiles, or at running '
+                             'quantiles accumulated across days (default: exact)')
+    parser.add_argument('--backend', choices=BACKENDS, default='netcdf4',
+                        help=BACKEND_HELP)
+    parser.add_argument('--store', default=None,
+                        help='Read the years from this chunked store (see chunked_store.py) '
+                             'instead of the Year_N files')
+    parser.add_argument('--timings', action='store_true',
+                        help='Write per-stage wall/CPU/RSS records to stage_timings_<timestamp>.jsonl')
+    parser.add_argument('--profile-dir', default=None,
+                        help='Also dump a cProfile file per process into this directory')
+    args = parser.parse_args()
+    timings = stage_timer.timings_path() if args.timings else None
+    stage_timer.configure(timings, args.profile_dir)
+
+    run_year(args.year, args.store, args.backend, args.workers, args.chunk, args.queue_depth, args.clip,
+             timings, args.profile_dir, args.read_ahead)
+    if timings:
+        print(f"Stage timings written to: {timings}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,119 +1,186 @@
 import numpy as np
-from netCDF4 import Dataset
-import matplotlib.pyplot as plt
-import sys
+import argparse
+from clip_utils import percentile
+from fill_values import valid_values
+from clim_cache import CACHE_DIR, ClimCache
+import numeric_export
+from derived_fields import QUIVER_STEP, quiver_grid
+from nc_region import BACKEND_HELP, BACKENDS, year_source, open_dataset
+from window_means import monthly_windows, running_windows, running_means, window_products, load_window_products
+import stage_timer
+from stage_timer import timer
 month_day_dict = {
     1: 'jan', 31: 'feb', 61: 'mar', 91: 'apr', 121: 'may', 151: 'jun',
     181: 'jul', 211: 'aug', 241: 'sep', 271: 'oct', 301: 'nov', 331: 'dec'
 }
 
-year = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+parser = argparse.ArgumentParser(description='30-day averaged vector/scalar plots for one year.')
+parser.add_argument('year', nargs='?', type=int, default=3, help='Year number to process (default: 3)')
+parser.add_argument('--running', type=int, default=None, metavar='N',
+                    help='Plot sliding N-day running means instead of the 30-day windows')
+parser.add_argument('--stride', type=int, default=1,
+                    help='With --running, days between successive windows (default: 1)')
+parser.add_argument('--cache-dir', default=CACHE_DIR,
+                    help=f'Directory for cached window means (default: {CACHE_DIR})')
+parser.add_argument('--no-cache', action='store_true',
+                    help='Always recompute window means from the NetCDF file')
+parser.add_argument('--backend', choices=BACKENDS, default='netcdf4',
+                    help=BACKEND_HELP)
+parser.add_argument('--store', default=None,
+                    help='Read the years from this chunked store (see chunked_store.py) '
+                         'instead of the Year_N files')
+parser.add_argument('--no-render', action='store_true',
+                    help='Skip the figures: write the window fields and statistics (numeric_export.py) '
+                         'without importing matplotlib')
+numeric_export.add_arguments(parser.add_argument_group('--no-render output'))
+parser.add_argument('--timings', action='store_true',
+                    help='Write per-stage wall/CPU/RSS records to stage_timings_<timestamp>.jsonl')
+parser.add_argument('--profile-dir', default=None,
+                    help='Also dump a cProfile file into this directory')
+args = parser.parse_args()
+if args.no_render:
+    numeric_export.check_arguments(parser, args)
+timings = stage_timer.timings_path() if args.timings else None
+stage_timer.configure(timings, args.profile_dir)
+year = args.year
+cache = None if args.no_cache else ClimCache(args.cache_dir)
 # Load the NetCDF file
-ncfile = f'Year_{year}/year_{year}_combined.nc'  # Replace with your actual file
-ds = Dataset(ncfile)
+ncfile = year_source(year, args.store)
+ds = open_dataset(ncfile, args.backend)
 
 # Extract variables
 lon = ds.variables['lon'][:]
 lat = ds.variables['lat'][:]
-un = ds.variables['un'][:]  # shape: (time, lat, lon)
-vn = ds.variables['vn'][:]
-pn = ds.variables['pn'][:]
+# Plot grids are built once: the full meshgrid for pcolormesh and the arrow positions
+LON, LAT = np.meshgrid(lon, lat)
+QLON, QLAT = quiver_grid(lon, lat, QUIVER_STEP)
+# un/vn/pn are read in one pass over the averaging windows below, shape: (time, lat, lon)
+un = ds.variables['un']
+vn = ds.variables['vn']
+pn = ds.variables['pn']
 
 # Prompt user for time range
 day_init_min = 1
 day_final_max = 364
 
-def generate_plots(day_init, day_final):
+def load_window_means(windows):
+    # U/V/P means for every (day_init, day_final) window come from a single pass over
+    # the year; each window and its derived products are also cached on disk, so
+    # restyling a plot skips the read.
+    return load_window_products(ncfile, ds, windows, cache)
+
+def generate_plots(day_init, day_final, means=None):
     # Ensure valid indices
     if day_init < 0 or day_final >= un.shape[0] or day_init > day_final:
         raise ValueError("Invalid day indices. Please check the input values.")
 
     # Average over the specified time range (inclusive)
-    U = np.mean(un[day_init:day_final+1, :, :], axis=0)
-    V = np.mean(vn[day_init:day_final+1, :, :], axis=0)
-    P = np.mean(pn[day_init:day_final+1, :, :], axis=0)
-
-    # Mask fill values (Ferret uses 9.969e+36 as missing)
-    fill_value = 9.969e+36
-    U = np.ma.masked_where(U >= 1e+30, U)
-    V = np.ma.masked_where(V >= 1e+30, V)
-    P = np.ma.masked_where(P >= 1e+30, P)
-    
-    U = U / 10  # Convert wind speed to dm/s
-    V = V / 10  # Convert wind speed to dm/s
-    P = P / 980  # Convert pressure to hPa
-
-    # Create meshgrid for plotting
-    LON, LAT = np.meshgrid(lon, lat)
-    
-    # Calculate magnitude and filter extremes
-    magnitude = np.sqrt(U**2 + V**2)
-    q95 = np.percentile(magnitude.compressed(), 95)
-
-    # Create mask for reasonable vectors
-    reasonable_mask = magnitude < q95
-
-    # Apply mask to coordinates and vectors
-    LON_filtered = np.where(reasonable_mask, LON, np.nan)
-    LAT_filtered = np.where(reasonable_mask, LAT, np.nan)
-    U_filtered = np.where(reasonable_mask, U, np.nan)
-    V_filtered = np.where(reasonable_mask, V, np.nan)
-
-    # Plot
-    plt.figure(figsize=(10, 8))
-    cmap = plt.get_cmap('RdBu_r')  # Choose a colormap
-    # Some alternative color maps you can use:
-    # 'Accent', 'Accent_r', 'Blues', 'Blues_r', 'BrBG', 'BrBG_r', 'BuGn', 'BuGn_r', 'BuPu', 
-    # 'BuPu_r', 'CMRmap', 'CMRmap_r', 'Dark2', 'Dark2_r', 'GnBu', 'GnBu_r', 'Grays', 'Grays_r', 
-    # 'Greens', 'Greens_r', 'Greys', 'Greys_r', 'OrRd', 'OrRd_r', 'Oranges', 'Oranges_r', 'PRGn', 
-    # 'PRGn_r', 'Paired', 'Paired_r', 'Pastel1', 'Pastel1_r', 'Pastel2', 'Pastel2_r', 'PiYG', 
-    # 'PiYG_r', 'PuBu', 'PuBuGn', 'PuBuGn_r', 'PuBu_r', 'PuOr', 'PuOr_r', 'PuRd', 'PuRd_r', 
-    # 'Purples', 'Purples_r', 'RdBu', 'RdBu_r', 'RdGy', 'RdGy_r', 'RdPu', 'RdPu_r', 'RdYlBu', 
-    # 'RdYlBu_r', 'RdYlGn', 'RdYlGn_r', 'Reds', 'Reds_r', 'Set1', 'Set1_r', 'Set2', 'Set2_r', 
-    # 'Set3', 'Set3_r', 'Spectral', 'Spectral_r', 'Wistia', 'Wistia_r', 'YlGn', 'YlGnBu', 
-    # 'YlGnBu_r', 'YlGn_r', 'YlOrBr', 'YlOrBr_r', 'YlOrRd', 'YlOrRd_r', 'afmhot', 'afmhot_r', 
-    # 'autumn', 'autumn_r', 'berlin', 'berlin_r', 'binary', 'binary_r', 'bone', 'bone_r', 'brg', 
-    # 'brg_r', 'bwr', 'bwr_r', 'cividis', 'cividis_r', 'cool', 'cool_r', 'coolwarm', 'coolwarm_r', 
-    # 'copper', 'copper_r', 'cubehelix', 'cubehelix_r', 'flag', 'flag_r', 'gist_earth', 'gist_earth_r', 
-    # 'gist_gray', 'gist_gray_r', 'gist_grey', 'gist_grey_r', 'gist_heat', 'gist_heat_r', 'gist_ncar', 
-    # 'gist_ncar_r', 'gist_rainbow', 'gist_rainbow_r', 'gist_stern', 'gist_stern_r', 'gist_yarg', 
-    # 'gist_yarg_r', 'gist_yerg', 'gist_yerg_r', 'gnuplot', 'gnuplot2', 'gnuplot2_r', 'gnuplot_r', 
-    # 'gray', 'gray_r', 'grey', 'grey_r', 'hot', 'hot_r', 'hsv', 'hsv_r', 'inferno', 'inferno_r', 
-    # 'jet', 'jet_r', 'magma', 'magma_r', 'managua', 'managua_r', 'nipy_spectral', 'nipy_spectral_r', 
-    # 'ocean', 'ocean_r', 'pink', 'pink_r', 'plasma', 'plasma_r', 'prism', 'prism_r', 'rainbow', 
-    # 'rainbow_r', 'seismic', 'seismic_r', 'spring', 'spring_r', 'summer', 'summer_r', 'tab10', 
-    # 'tab10_r', 'tab20', 'tab20_r', 'tab20b', 'tab20b_r', 'tab20c', 'tab20c_r', 'terrain', 
-    # 'terrain_r', 'turbo', 'turbo_r', 'twilight', 'twilight_r', 'twilight_shifted', 
-    # 'twilight_shifted_r', 'vanimo', 'vanimo_r', 'viridis', 'viridis_r', 'winter', 'winter_r'
-    pc = plt.pcolormesh(LON, LAT, P, cmap=cmap, shading='nearest', vmin=-20, vmax=20)
-    # To use another, just change 'viridis' to your preferred colormap name.
-    plt.colorbar(pc, label='pn')
-
-    # Quiver (vector field)
-    # To avoid clutter, plot every Nth arrow
-    step = 8
-    plt.quiver(LON_filtered[::step, ::step], LAT_filtered[::step, ::step], 
-            U_filtered[::step, ::step], V_filtered[::step, ::step], 
-            scale=50, color='k', width=0.002, headwidth=3)
-
-    plt.xlabel('Longitude')
-    plt.ylabel('Latitude')
-    plt.title('Year {}: (Averaged from index {} to {})'.format(year, day_init, day_final))
-    plt.tight_layout()
-    month = month_day_dict.get(day_init, 'dec')
-    plt.savefig(f'year-{year}-{month}-wind_clim.png', dpi=200)
+    if means is None:
+        means = load_window_means([(day_init, day_final)])[0]
+    with timer.context(window=f'{day_init}-{day_final}'):
+        plot_window(day_init, day_final, means)
+
+def plot_window(day_init, day_final, fields, label=None):
+    # pyplot loads with the first plot, so --no-render never imports it
+    import matplotlib.pyplot as plt
+
+    with timer.stage('mask'):
+        # Fill values (Ferret uses 9.969e+36 as missing) are already NaN in the window means;
+        # converted in float64 like the numpy.ma arithmetic this replaced. U and V come
+        # precomputed in dm/s as speed and decimated arrows (derived_fields).
+        P = fields['P'].astype(np.float64) / 980  # Convert pressure to hPa
+
+    with timer.stage('percentile'):
+        # Filter extremes: only arrows slower than the 95th percentile of the speed
+        q95 = percentile(valid_values(fields['speed']), 95)
+        step = QUIVER_STEP
+        reasonable_mask = fields['speed'][::step, ::step] < q95
+
+        # Apply mask to the arrow positions and vectors
+        LON_filtered = np.where(reasonable_mask, QLON, np.nan)
+        LAT_filtered = np.where(reasonable_mask, QLAT, np.nan)
+        U_filtered = np.where(reasonable_mask, fields['quiver_U'], np.nan)
+        V_filtered = np.where(reasonable_mask, fields['quiver_V'], np.nan)
+
+    with timer.stage('plot'):
+        # Plot
+        plt.figure(figsize=(10, 8))
+        cmap = plt.get_cmap('RdBu_r')  # Choose a colormap
+        # Some alternative color maps you can use:
+        # 'Accent', 'Accent_r', 'Blues', 'Blues_r', 'BrBG', 'BrBG_r', 'BuGn', 'BuGn_r', 'BuPu', 
+        # 'BuPu_r', 'CMRmap', 'CMRmap_r', 'Dark2', 'Dark2_r', 'GnBu', 'GnBu_r', 'Grays', 'Grays_r', 
+        # 'Greens', 'Greens_r', 'Greys', 'Greys_r', 'OrRd', 'OrRd_r', 'Oranges', 'Oranges_r', 'PRGn', 
+        # 'PRGn_r', 'Paired', 'Paired_r', 'Pastel1', 'Pastel1_r', 'Pastel2', 'Pastel2_r', 'PiYG', 
+        # 'PiYG_r', 'PuBu', 'PuBuGn', 'PuBuGn_r', 'PuBu_r', 'PuOr', 'PuOr_r', 'PuRd', 'PuRd_r', 
+        # 'Purples', 'Purples_r', 'RdBu', 'RdBu_r', 'RdGy', 'RdGy_r', 'RdPu', 'RdPu_r', 'RdYlBu', 
+        # 'RdYlBu_r', 'RdYlGn', 'RdYlGn_r', 'Reds', 'Reds_r', 'Set1', 'Set1_r', 'Set2', 'Set2_r', 
+        # 'Set3', 'Set3_r', 'Spectral', 'Spectral_r', 'Wistia', 'Wistia_r', 'YlGn', 'YlGnBu', 
+        # 'YlGnBu_r', 'YlGn_r', 'YlOrBr', 'YlOrBr_r', 'YlOrRd', 'YlOrRd_r', 'afmhot', 'afmhot_r', 
+        # 'autumn', 'autumn_r', 'berlin', 'berlin_r', 'binary', 'binary_r', 'bone', 'bone_r', 'brg', 
+        # 'brg_r', 'bwr', 'bwr_r', 'cividis', 'cividis_r', 'cool', 'cool_r', 'coolwarm', 'coolwarm_r', 
+        # 'copper', 'copper_r', 'cubehelix', 'cubehelix_r', 'flag', 'flag_r', 'gist_earth', 'gist_earth_r', 
+        # 'gist_gray', 'gist_gray_r', 'gist_grey', 'gist_grey_r', 'gist_heat', 'gist_heat_r', 'gist_ncar', 
+        # 'gist_ncar_r', 'gist_rainbow', 'gist_rainbow_r', 'gist_stern', 'gist_stern_r', 'gist_yarg', 
+        # 'gist_yarg_r', 'gist_yerg', 'gist_yerg_r', 'gnuplot', 'gnuplot2', 'gnuplot2_r', 'gnuplot_r', 
+        # 'gray', 'gray_r', 'grey', 'grey_r', 'hot', 'hot_r', 'hsv', 'hsv_r', 'inferno', 'inferno_r', 
+        # 'jet', 'jet_r', 'magma', 'magma_r', 'managua', 'managua_r', 'nipy_spectral', 'nipy_spectral_r', 
+        # 'ocean', 'ocean_r', 'pink', 'pink_r', 'plasma', 'plasma_r', 'prism', 'prism_r', 'rainbow', 
+        # 'rainbow_r', 'seismic', 'seismic_r', 'spring', 'spring_r', 'summer', 'summer_r', 'tab10', 
+        # 'tab10_r', 'tab20', 'tab20_r', 'tab20b', 'tab20b_r', 'tab20c', 'tab20c_r', 'terrain', 
+        # 'terrain_r', 'turbo', 'turbo_r', 'twilight', 'twilight_r', 'twilight_shifted', 
+        # 'twilight_shifted_r', 'vanimo', 'vanimo_r', 'viridis', 'viridis_r', 'winter', 'winter_r'
+        pc = plt.pcolormesh(LON, LAT, P, cmap=cmap, shading='nearest', vmin=-20, vmax=20)
+        # To use another, just change 'viridis' to your preferred colormap name.
+        plt.colorbar(pc, label='pn')
+
+        # Quiver (vector field)
+        # To avoid clutter, plot every Nth arrow (already decimated to every QUIVER_STEP-th)
+        plt.quiver(LON_filtered, LAT_filtered, U_filtered, V_filtered,
+                   scale=50, color='k', width=0.002, headwidth=3)
+
+        plt.xlabel('Longitude')
+        plt.ylabel('Latitude')
+        plt.title('Year {}: (Averaged from index {} to {})'.format(year, day_init, day_final))
+    with timer.stage('tight_layout'):
+        plt.tight_layout()
+    label = label or month_day_dict.get(day_init, 'dec')
+    with timer.stage('savefig'):
+        plt.savefig(f'year-{year}-{label}-wind_clim.png', dpi=200)
     plt.close()  # Close the plot to free memory
 
 def main_loop():
-    for day_init in range(day_init_min, day_final_max + 1,30):
-        day_final = day_init + 29
-        if day_final > day_final_max or day_init == 331:
-            day_final = day_final_max
-        if day_init == 361:
-            continue
+    windows = monthly_windows(day_init_min, day_final_max)
+    all_means = load_window_means(windows)
+    for (day_init, day_final), means in zip(windows, all_means):
         print(f"Year {year}: Generating plot for days {day_init} to {day_final}...")
-        generate_plots(day_init, day_final)
-        
+        generate_plots(day_init, day_final, means)
+
+def running_loop(width, stride=1):
+    # Running means are streamed from one pass over the year and plotted as they come
+    # (not cached: there is one window per day)
+    variables = {'U': un, 'V': vn, 'P': pn}
+    for start, stop, means in running_means(variables, width, stride, start=day_init_min, stop=day_final_max + 1):
+        day_init, day_final = start, stop - 1
+        print(f"Year {year}: Generating {width}-day running mean plot for days {day_init} to {day_final}...")
+        with timer.context(window=f'{day_init}-{day_final}'):
+            plot_window(day_init, day_final, window_products(means), f'running{width}-day{day_init:03d}')
+
 if __name__ == "__main__":
-    main_loop()
-    print(f"Year {year}: All plots generated successfully.")
\ No newline at end of file
+    if args.running is not None and (args.running < 1 or args.stride < 1):
+        parser.error('--running and --stride must be at least 1')
+    if args.no_render:
+        if args.running is not None:
+            windows = running_windows(args.running, args.stride, day_init_min, day_final_max)
+        else:
+            windows = monthly_windows(day_init_min, day_final_max)
+        numeric_export.export_years([year], args.export_prefix, ('window',), cache, args.backend, args.store,
+                                    windows=windows, read_ahead=0, table_format=args.table_format)
+    else:
+        with timer.stage('year', year=year):
+            if args.running is not None:
+                running_loop(args.running, args.stride)
+            else:
+                main_loop()
+        print(f"Year {year}: All plots generated successfully.")
+    if timings:
+        print(f"Stage timings written to: {timings}")
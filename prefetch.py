@@ -0,0 +1,91 @@
+import queue
+import threading
+from stage_timer import timer
+
+# Read-ahead for the plotting scripts: a background thread runs an iterator (reading
+# and reducing the next year, or the next chunk of days) and parks up to `depth`
+# results in a queue while the main thread renders the current one. Disk or network
+# reads and numpy reductions then overlap with matplotlib.
+#
+#   for year, fields in prefetch(((year, load(year)) for year in years), depth=1):
+#       render(year, fields)
+#
+# Only the background thread touches the source iterator (and so its open datasets).
+# With depth 0 the iterator runs inline, as it did before.
+#
+# netCDF-C and the HDF5 under it are not thread-safe, and netCDF4 releases the GIL
+# around its calls, so two threads must never be inside the library at once. The
+# background thread holds nc_lock while it produces each item; code on another thread
+# that reads or writes netCDF files while a prefetch runs (an output file written as
+# the years come in, say) takes it too:
+#
+#   with nc_lock:
+#       out.variables['un_anomaly'][k] = field
+
+_END = object()
+
+nc_lock = threading.RLock()
+
+
+class Prefetcher:
+    def __init__(self, iterable, depth=1, name='prefetch'):
+        self.queue = queue.Queue(maxsize=max(1, depth))
+        self.stopped = threading.Event()
+        # Stages recorded by the thread carry the labels in effect where it was started
+        self.thread = threading.Thread(target=self._fill, args=(iter(iterable), timer.labels),
+                                       name=name, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        # Wait for room in the queue, unless the consumer has gone away
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _fill(self, iterator, labels):
+        with timer.context(**labels):
+            try:
+                while True:
+                    with nc_lock:
+                        try:
+                            item = next(iterator)
+                        except StopIteration:
+                            break
+                    if not self._put((item, None)):
+                        return
+            except BaseException as exc:  # re-raised in the consumer
+                self._put((_END, exc))
+                return
+            finally:
+                # A generator stopped early closes its datasets here, under the lock
+                if hasattr(iterator, 'close'):
+                    with nc_lock:
+                        iterator.close()
+        self._put((_END, None))
+
+    def __iter__(self):
+        try:
+            while True:
+                item, exc = self.queue.get()
+                if item is _END:
+                    if exc is not None:
+                        raise exc
+                    return
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        # Stop reading ahead; waits for the item being produced, if any
+        self.stopped.set()
+        self.thread.join()
+
+
+def prefetch(iterable, depth=1, name='prefetch'):
+    if depth <= 0:
+        return iter(iterable)
+    return iter(Prefetcher(iterable, depth, name))
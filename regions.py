@@ -0,0 +1,134 @@
+import json
+import numpy as np
+from nc_region import BAY_OF_BENGAL, region_slices
+
+# Named regions of interest. A region is a lat/lon box in the same
+# {'lat': (lo, hi), 'lon': (lo, hi)} form as nc_region.BAY_OF_BENGAL, plus a 'label'
+# for titles and optionally a 'polygon' of (lon, lat) vertices: only cells whose
+# centres fall inside it are kept.
+#
+# RegionIndex resolves a set of regions against one grid once: the hyperslab covering
+# all of them, so a year is read and reduced in a single pass, and per region the
+# slices into that block and the polygon mask.
+
+REGIONS = {
+    'bay_of_bengal': dict(BAY_OF_BENGAL, label='Bay of Bengal'),
+    'arabian_sea': {'lat': (5, 25), 'lon': (50, 78), 'label': 'Arabian Sea'},
+    'full_domain': {'lat': (-90, 90), 'lon': (-180, 360), 'label': 'Full domain'},
+}
+DEFAULT_REGION = 'bay_of_bengal'
+
+
+def make_region(name, lat=None, lon=None, polygon=None, label=None):
+    # A polygon's box defaults to the polygon's bounds
+    region = {}
+    if polygon is not None:
+        polygon = [(float(x), float(y)) for x, y in polygon]
+        if len(polygon) < 3:
+            raise ValueError(f"Region {name!r}: a polygon needs at least 3 vertices.")
+        xs, ys = zip(*polygon)
+        lat = lat if lat is not None else (min(ys), max(ys))
+        lon = lon if lon is not None else (min(xs), max(xs))
+    if lat is None or lon is None:
+        raise ValueError(f"Region {name!r} needs 'lat' and 'lon' bounds or a 'polygon'.")
+    region['lat'] = tuple(float(v) for v in lat)
+    region['lon'] = tuple(float(v) for v in lon)
+    if polygon is not None:
+        region['polygon'] = polygon
+    region['label'] = label or name
+    return region
+
+
+def load_regions(path):
+    # User-defined regions from a JSON file:
+    #   {"andaman": {"lat": [6, 14], "lon": [92, 94]},
+    #    "sri_lanka_dome": {"polygon": [[80, 5], [88, 5], [88, 11], [80, 11]], "label": "Sri Lanka Dome"}}
+    with open(path) as f:
+        specs = json.load(f)
+    return {name: make_region(name, **spec) for name, spec in specs.items()}
+
+
+def select_regions(names, extra=None):
+    # Registry entries (plus user-defined ones) for the requested names, in order
+    available = dict(REGIONS, **(extra or {}))
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown region(s) {', '.join(unknown)}; "
+                         f"available: {', '.join(sorted(available))}.")
+    return {name: available[name] for name in names}
+
+
+def cache_spec(region):
+    # The part of a region that determines its data (not its label), for cache keys.
+    # The Bay of Bengal box gives the same spec as BAY_OF_BENGAL did before the registry.
+    return {key: region[key] for key in ('lat', 'lon', 'polygon') if key in region}
+
+
+def grid_edges(coord):
+    # Outer cell edges of a regular, monotonic coordinate (half a cell beyond the centres)
+    coord = np.asarray(coord, dtype=np.float64)
+    half = abs(coord[1] - coord[0]) / 2 if coord.size > 1 else 0.0
+    return float(coord.min() - half), float(coord.max() + half)
+
+
+def polygon_mask(lat, lon, polygon):
+    # Boolean (lat, lon) mask of the cells whose centres are inside the polygon (even-odd rule)
+    LON, LAT = np.meshgrid(np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+    inside = np.zeros(LON.shape, dtype=bool)
+    x0, y0 = polygon[-1]
+    for x1, y1 in polygon:
+        crosses = (y1 > LAT) != (y0 > LAT)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x0 + (LAT - y0) * (x1 - x0) / (y1 - y0)
+        inside ^= crosses & (LON < x_cross)
+        x0, y0 = x1, y1
+    return inside
+
+
+class RegionIndex:
+    def __init__(self, lat, lon, regions):
+        self.lat = np.asarray(lat)
+        self.lon = np.asarray(lon)
+        self.regions = dict(regions)
+        self.slices = {name: region_slices(self.lat, self.lon, region) for name, region in self.regions.items()}
+        self.masks = {}
+        for name, region in self.regions.items():
+            if 'polygon' in region:
+                lat_slice, lon_slice = self.slices[name]
+                self.masks[name] = polygon_mask(self.lat[lat_slice], self.lon[lon_slice], region['polygon'])
+
+    def matches(self, lat, lon, regions):
+        return (np.array_equal(self.lat, lat) and np.array_equal(self.lon, lon)
+                and self.regions == dict(regions))
+
+    def bounds(self, names=None):
+        # Hyperslab covering the named regions (default: all). Regions far apart share
+        # one read of the box between them, which is still a single contiguous pass.
+        names = list(self.regions) if names is None else names
+        lat_slices = [self.slices[name][0] for name in names]
+        lon_slices = [self.slices[name][1] for name in names]
+        return (slice(min(s.start for s in lat_slices), max(s.stop for s in lat_slices)),
+                slice(min(s.start for s in lon_slices), max(s.stop for s in lon_slices)))
+
+    def coords(self, name):
+        lat_slice, lon_slice = self.slices[name]
+        return self.lat[lat_slice], self.lon[lon_slice]
+
+    def extent(self, name):
+        # Map extent (lon0, lon1, lat0, lat1): the region's box, clipped to the grid's cell edges
+        region = self.regions[name]
+        lon0, lon1 = grid_edges(self.lon)
+        lat0, lat1 = grid_edges(self.lat)
+        return (max(region['lon'][0], lon0), min(region['lon'][1], lon1),
+                max(region['lat'][0], lat0), min(region['lat'][1], lat1))
+
+    def cut(self, name, field, bounds=None):
+        # The region's part of a (..., lat, lon) field covering `bounds` (default: all
+        # regions). Boxes are views; polygon regions are copies with NaN outside.
+        lat_bound, lon_bound = bounds or self.bounds()
+        lat_slice, lon_slice = self.slices[name]
+        sub = field[..., lat_slice.start - lat_bound.start:lat_slice.stop - lat_bound.start,
+                    lon_slice.start - lon_bound.start:lon_slice.stop - lon_bound.start]
+        if name in self.masks:
+            sub = np.where(self.masks[name], sub, np.nan).astype(sub.dtype)
+        return sub
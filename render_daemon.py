@@ -0,0 +1,175 @@
+import io
+import os
+import sys
+import runpy
+import argparse
+import tempfile
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+from multiprocessing.connection import Client, Listener
+import stage_timer
+
+# Long-lived render service. Starting one of the plot scripts costs an interpreter,
+# the matplotlib / cartopy / shapely / netCDF4 imports and the Natural Earth
+# coastline and land geometries, all before the first day is read. The daemon pays
+# that once; each job then runs a script in the warm process exactly as its command
+# line would, with the caller's working directory and arguments:
+#
+#   python render_daemon.py serve &
+#   python render_daemon.py run plot_vector_scalar_og.py 11 --workers 4
+#   python render_daemon.py run plot_vector_scalar_yearwise.py 12 --no-cache
+#   python render_daemon.py stop
+#
+# Jobs run one at a time (they share the process's cwd, argv and figures); start a
+# daemon per socket for more. Scripts are re-read for every job, but the modules they
+# import are not: restart the daemon after editing those. A job's stage timings and
+# profile (--timings, --profile-dir) are closed when it ends. Its output is captured
+# at file descriptors 1 and 2, so what pool workers forked by the job print goes back
+# to the client too (workers started by a forkserver print to the daemon's output).
+# The socket is only accessible to its owner, and the messages are pickles, so only
+# that user's own jobs are accepted.
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = ('plot_vector_scalar.py', 'plot_vector_scalar_og.py', 'plot_vector_scalar_yearwise.py',
+           'multi_year_clim.py', 'numeric_export.py', 'mode_decomp.py')
+
+
+def default_socket():
+    return os.path.join(tempfile.gettempdir(), f'ncpor-render-{os.getuid()}.sock')
+
+
+def warm_up():
+    # Import the rendering stack and load the coastline/land geometries the season
+    # maps draw (cartopy keeps them cached per process) by rendering one throwaway map
+    import numpy as np
+    import matplotlib
+    matplotlib.use('Agg')
+    import netCDF4  # noqa: F401
+    from map_frame import daily_frame, season_frame
+
+    lon = np.linspace(75, 100, 8)
+    lat = np.linspace(5, 30, 8)
+    field = np.zeros((8, 8))
+    frames = [daily_frame(lon, lat, field, field, field, '')]
+    try:
+        frames.append(season_frame(lon, lat, field, field, field, ''))
+    except ImportError:
+        print("cartopy is not installed; season maps will fail")
+    for frame in frames:
+        frame.save(io.BytesIO(), dpi=50)
+        frame.close()
+
+
+def run_script(script, args, cwd):
+    # Run one script as `python script args...` from `cwd`; returns (exit code, output)
+    import matplotlib.pyplot as plt
+
+    path = script if os.path.isabs(script) else os.path.join(REPO, script)
+    saved = os.getcwd(), sys.argv
+    code = 0
+    # stdout and stderr, at the descriptor level so forked pool workers (and C
+    # libraries) write there too, go to a temporary file for the job's duration.
+    # The text stream is unbuffered so a fork never copies pending output.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    capture = tempfile.TemporaryFile()
+    saved_fds = os.dup(1), os.dup(2)
+    os.dup2(capture.fileno(), 1)
+    os.dup2(capture.fileno(), 2)
+    output = io.TextIOWrapper(io.FileIO(1, 'w', closefd=False), write_through=True)
+    try:
+        os.chdir(cwd)
+        sys.argv = [path] + list(args)
+        with redirect_stdout(output), redirect_stderr(output):
+            try:
+                runpy.run_path(path, run_name='__main__')
+            except SystemExit as exc:
+                if exc.code is None or isinstance(exc.code, int):
+                    code = exc.code or 0
+                else:
+                    print(exc.code)  # sys.exit('message')
+                    code = 1
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                stage_timer.reset()  # write the job's profile; later jobs start untimed
+    finally:
+        os.chdir(saved[0])
+        sys.argv = saved[1]
+        plt.close('all')
+        output.flush()
+        for fd, saved_fd in zip((1, 2), saved_fds):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+    with capture:
+        capture.seek(0)
+        return code, capture.read().decode(errors='replace')
+
+
+def serve(address=None):
+    address = address or default_socket()
+    if os.path.exists(address):
+        os.remove(address)  # left over from a daemon that did not shut down cleanly
+    sys.path.insert(0, REPO)
+    old_umask = os.umask(0o177)  # socket file readable and writable by the owner only
+    try:
+        listener = Listener(address, family='AF_UNIX')
+    finally:
+        os.umask(old_umask)
+    warm_up()
+    print(f"Render daemon listening on {address}")
+    with listener:
+        while True:
+            with listener.accept() as conn:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    continue
+                if request.get('stop'):
+                    conn.send((0, 'Render daemon stopped\n'))
+                    break
+                print(f"Job: {request['script']} {' '.join(request['args'])}")
+                conn.send(run_script(request['script'], request['args'], request['cwd']))
+
+
+def submit(script, args=(), cwd=None, address=None):
+    # Send a job and wait for its exit code and captured output
+    with Client(address or default_socket(), family='AF_UNIX') as conn:
+        conn.send({'script': script, 'args': list(args), 'cwd': cwd or os.getcwd()})
+        return conn.recv()
+
+
+def stop(address=None):
+    with Client(address or default_socket(), family='AF_UNIX') as conn:
+        conn.send({'stop': True})
+        return conn.recv()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Keep the plotting stack warm in one process and run jobs in it.')
+    parser.add_argument('--socket', default=None, help=f'Unix socket path (default: {default_socket()})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('serve', help='Start the daemon (runs until stopped)')
+    run = commands.add_parser('run', help='Run a plot script in the daemon')
+    run.add_argument('script', help=f"Script path, or one of: {', '.join(SCRIPTS)}")
+    run.add_argument('args', nargs=argparse.REMAINDER, help="The script's own arguments")
+    commands.add_parser('stop', help='Stop the daemon')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.socket)
+    else:
+        try:
+            if args.command == 'run':
+                script = args.script if os.path.isabs(args.script) else os.path.abspath(args.script)
+                if not os.path.exists(script):
+                    script = args.script  # relative to the repository, resolved by the daemon
+                code, output = submit(script, args.args, address=args.socket)
+            else:
+                code, output = stop(args.socket)
+        except (FileNotFoundError, ConnectionRefusedError):
+            sys.exit(f"No render daemon on {args.socket or default_socket()}; start one with "
+                     f"'python render_daemon.py serve'")
+        sys.stdout.write(output)
+        sys.exit(code)
@@ -0,0 +1,61 @@
+import os
+import argparse
+from image_store import default_store
+from grid_compositor import add_arguments, compose_grid, grid_options
+
+# Season grids for Image_output and LCS-seasons-images (one script for both folders):
+# each {folder}/{Season}/ holds the per-year images, composed into {output}/{Season}.png
+#
+#   python season_grid.py --folder Image_output
+#   python season_grid.py --folder LCS-seasons-images --webp
+
+# Grid configuration
+rows, cols = 3, 4
+cell_bg = (255, 255, 255)  # white background
+cell_width = None  # optional cell width in pixels; None keeps the first image's size
+
+# List your seasons here
+seasons = ['Spring', 'Summer', 'Autumn', 'Winter']
+
+# Supported image file extensions
+exts = ('.png', '.jpg', '.jpeg')
+
+def make_season_grid(season_folder, output_filename, **options):
+    # Gather all image files in the season folder
+    image_files = [f for f in os.listdir(season_folder) if f.lower().endswith(exts)]
+    image_files.sort()  # Use a specific order if you want; remove or change as needed
+
+    # Take up to max grid slots; sizes come from the file headers
+    paths = [os.path.join(season_folder, f) for f in image_files[:rows * cols]]
+
+    if not paths:
+        print(f"No images found for {season_folder}")
+        return
+
+    # Use the size of the first image as the standard cell size
+    cell_width_px, cell_height = default_store.size(paths[0])
+    if cell_width:
+        cell_width_px, cell_height = cell_width, round(cell_height * cell_width / cell_width_px)
+
+    # Tiles are loaded at the cell size in parallel (see grid_compositor.py)
+    compose_grid(paths, output_filename, rows, cols, (cell_width_px, cell_height), cell_bg, **options)
+    print(f"Saved {output_filename}")
+
+# Run for each season
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compose each season folder into a 3x4 grid.')
+    parser.add_argument('--folder', default='.',
+                        help='Folder holding the Spring/Summer/Autumn/Winter subfolders (default: .)')
+    parser.add_argument('--output', default=None,
+                        help='Directory for the <Season>.png grids (default: --folder)')
+    add_arguments(parser)
+    args = parser.parse_args()
+    output_dir = args.output or args.folder
+    os.makedirs(output_dir, exist_ok=True)
+    for season in seasons:
+        folder = os.path.join(args.folder, season)  # assumes subfolder is named exactly as the season
+        output_file = os.path.join(output_dir, f"{season}.{'webp' if args.webp else 'png'}")
+        if os.path.isdir(folder):
+            make_season_grid(folder, output_file, **grid_options(args))
+        else:
+            print(f"Folder '{folder}' not found, skipping.")
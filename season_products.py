@@ -0,0 +1,98 @@
+import numpy as np
+from derived_fields import QUIVER_STEP, derive
+from nc_region import read_region
+from regions import DEFAULT_REGION, RegionIndex, cache_spec
+from season_reducer import SEASON_DAYS, reduce_seasons
+from static_mask import region_mask
+from stage_timer import timer
+
+# The season means of the plotted regions and the products drawn from them, shared by
+# plot_vector_scalar.py and numeric_export.py (its --no-render output)
+
+_region_index = None
+
+
+def get_region_index(lat, lon, regions):
+    # Region slices and polygon masks are resolved once per grid, not per year
+    global _region_index
+    if _region_index is None or not _region_index.matches(lat, lon, regions):
+        _region_index = RegionIndex(lat, lon, regions)
+    return _region_index
+
+
+def region_season_fields(index, name, season_fields, bounds):
+    # A region's season means cut out of ones reduced over a larger block (the means
+    # are per cell, so this is exactly what reducing the region on its own gives),
+    # plus their derived products (magnitude, decimated arrows, ...) for the plots
+    fields = {}
+    for season, union in season_fields.items():
+        U = index.cut(name, union['U'], bounds)
+        V = index.cut(name, union['V'], bounds)
+        products = derive(U, V, step=QUIVER_STEP)
+        fields[season] = {
+            'U': U,
+            'V': V,
+            **products,
+            'min_magnitude': float(np.nanmin(products['magnitude'])),
+            'max_magnitude': float(np.nanmax(products['magnitude'])),
+        }
+    return fields
+
+
+def load_season_fields(ncfile, ds, index, cache=None):
+    # Season means are cached on disk per (file, region, season). The un/vn block
+    # covering every region still missing is read and reduced once, and each of those
+    # regions is cut out of it.
+    keys = {}
+    region_fields = {}
+    missing = list(index.regions)
+    if cache is not None:
+        missing = []
+        for name, region in index.regions.items():
+            keys[name] = {}
+            fields = {}
+            for season, days in SEASON_DAYS.items():
+                keys[name][season] = cache.key(ncfile, 'un,vn', cache_spec(region), days, scale=100,
+                                               step=QUIVER_STEP)
+                with timer.stage('cache_load', season=season, region=name):
+                    fields[season] = cache.load(keys[name][season])
+            if all(season_fields is not None for season_fields in fields.values()):
+                region_fields[name] = fields
+            else:
+                missing.append(name)
+        if not missing:
+            print(f"Loaded season means from cache: {cache.cache_dir}")
+            return region_fields
+
+    bounds = index.bounds(missing)
+    # Land cells are dropped as each variable is read, once static_mask.py has checked the file
+    with timer.stage('static_mask'):
+        mask = region_mask(ncfile, ds, *bounds)
+    pack = mask.pack if mask is not None else (lambda block: block)
+    with timer.stage('read'):
+        un = pack(read_region(ds.variables['un'], None, *bounds))
+        vn = pack(read_region(ds.variables['vn'], None, *bounds))
+
+    # Reduce all seasons in one pass over the block
+    with timer.stage('reduce'):
+        season_fields = reduce_seasons(un, vn, SEASON_DAYS, scale=100, mask=mask)  # convert to dm/s
+    for name in missing:
+        region_fields[name] = region_season_fields(index, name, season_fields, bounds)
+        if cache is not None:
+            for season, fields in region_fields[name].items():
+                with timer.stage('cache_store', season=season, region=name):
+                    cache.store(keys[name][season], fields)
+    return region_fields
+
+
+def full_year_name(year):
+    if len(year) == 1:
+        return '200' + year
+    return '20' + year
+
+
+def log_entry(season, region=DEFAULT_REGION, label='Bay of Bengal'):
+    # Variation log key of a season: the season alone for the Bay of Bengal
+    if region == DEFAULT_REGION:
+        return season
+    return f'{season} ({label})'
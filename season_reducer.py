@@ -0,0 +1,62 @@
+import numpy as np
+from fill_values import split_valid, nan_mean
+
+# Define seasons with day indices (0-based day of year)
+SEASON_DAYS = {
+    'Winter': list(range(334, 365)) + list(range(0, 31)) + list(range(31, 60)),
+    'Summer': list(range(60, 91)) + list(range(91, 121)) + list(range(121, 152)),
+    'Spring': list(range(152, 182)) + list(range(182, 213)) + list(range(213, 243)),
+    'Autumn': list(range(243, 274)) + list(range(274, 304)) + list(range(304, 334))
+}
+
+
+def season_index(n_days, seasons=SEASON_DAYS):
+    # Map every day to the position of its season in `seasons` (-1 = not in any season)
+    idx = np.full(n_days, -1, dtype=np.intp)
+    for k, days in enumerate(seasons.values()):
+        days = [d for d in days if d < n_days]
+        idx[days] = k
+    return idx
+
+
+def _season_runs(idx):
+    # Split the day->season index into contiguous runs of the same season.
+    # Returns run start offsets and the season of each run (runs outside any season dropped).
+    starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+    groups = idx[starts]
+    return starts, groups
+
+
+def grouped_sums(block, idx, n_groups):
+    # Sum valid values and count them per group along the time axis of a NaN-filled
+    # (time, lat, lon) block.
+    filled, valid = split_valid(block)
+
+    starts, groups = _season_runs(idx)
+    run_sums = np.add.reduceat(filled, starts, axis=0, dtype=np.float64)
+    run_counts = np.add.reduceat(valid, starts, axis=0)
+
+    keep = groups >= 0
+    sums = np.zeros((n_groups,) + block.shape[1:], dtype=np.float64)
+    counts = np.zeros((n_groups,) + block.shape[1:], dtype=np.int64)
+    np.add.at(sums, groups[keep], run_sums[keep])
+    np.add.at(counts, groups[keep], run_counts[keep])
+    return sums, counts
+
+
+def reduce_seasons(un, vn, seasons=SEASON_DAYS, scale=100, mask=None):
+    # Compute all season means of U and V (divided by `scale`) in one pass over
+    # NaN-filled (time, lat, lon) blocks. The blocks may instead be (time, n_ocean)
+    # ocean cells packed by a static_mask.StaticMask, passed as `mask`; the sums then
+    # skip land and the means come back on its grid. Magnitudes and arrows are derived
+    # once per region from these (derived_fields.derive), not here.
+    idx = season_index(un.shape[0], seasons)
+    n_groups = len(seasons)
+    U_sums, U_counts = grouped_sums(un, idx, n_groups)
+    V_sums, V_counts = grouped_sums(vn, idx, n_groups)
+    if mask is not None:
+        U_sums, U_counts, V_sums, V_counts = (mask.unpack(a, 0) for a in (U_sums, U_counts, V_sums, V_counts))
+
+    return {season: {'U': nan_mean(U_sums[k], U_counts[k], scale),
+                     'V': nan_mean(V_sums[k], V_counts[k], scale)}
+            for k, season in enumerate(seasons)}
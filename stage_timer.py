@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import datetime
+import threading
+from contextlib import contextmanager
+from multiprocessing import util
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Per-stage instrumentation for the plotting scripts. Each stage records wall time,
+# CPU time, current and peak RSS plus the labels in effect (year, season, day, ...)
+# as one JSON line. Records are appended one line per write, so the worker
+# processes of a pool can share one file. Disabled (no file) it costs nothing.
+# Labels are per thread, so stages run by a prefetch thread keep their own.
+#
+#   with timer.context(year='2012'):
+#       with timer.stage('read'):
+#           ...
+
+
+def timestamp():
+    # Same format as the variation_log_*.txt names
+    return datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+
+def timings_path(stamp=None):
+    return f"stage_timings_{stamp or timestamp()}.jsonl"
+
+
+def rss_mb():
+    # Current resident set size (Linux /proc only)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    # High-water mark of this process so far
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2**20 if sys.platform == 'darwin' else 2**10)  # bytes on macOS, KiB elsewhere
+
+
+class StageTimer:
+    def __init__(self, path=None):
+        self.path = path
+        self._local = threading.local()
+        self.profiler = None
+        self._dump = None  # the pending dump_profile finalizer
+        self._profiles = {}  # profiles started so far, per pid
+
+    @property
+    def labels(self):
+        return getattr(self._local, 'labels', {})
+
+    @labels.setter
+    def labels(self, labels):
+        self._local.labels = labels
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    @contextmanager
+    def context(self, **labels):
+        # Labels attached to every stage recorded inside the block
+        saved = self.labels
+        self.labels = {**saved, **labels}
+        try:
+            yield
+        finally:
+            self.labels = saved
+
+    @contextmanager
+    def stage(self, name, **labels):
+        if not self.enabled:
+            yield
+            return
+        with self.context(**labels):
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            try:
+                yield
+            finally:
+                self.record(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def record(self, name, wall, cpu):
+        current, peak = rss_mb(), peak_rss_mb()
+        record = {'stage': name, **self.labels,
+                  'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6),
+                  'rss_mb': None if current is None else round(current, 1),
+                  'peak_rss_mb': None if peak is None else round(peak, 1),
+                  'pid': os.getpid()}
+        if threading.current_thread() is not threading.main_thread():
+            record['thread'] = threading.current_thread().name
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def start_profile(self, profile_dir):
+        # cProfile this process; the stats go to profile_dir/profile_<pid>.prof on exit
+        # (or at finish_profile). Later profiles of the same process get a _<n> suffix.
+        self.finish_profile()
+        if self.profiler is not None:
+            self.profiler.disable()  # inherited from a forked parent
+        os.makedirs(profile_dir, exist_ok=True)
+        pid = os.getpid()
+        count = self._profiles.get(pid, 0)
+        self._profiles[pid] = count + 1
+        name = f'profile_{pid}' + (f'_{count}' if count else '')
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        # multiprocessing finalizers also run when pool workers exit, unlike atexit
+        self._dump = util.Finalize(None, self.dump_profile,
+                                   args=(os.path.join(profile_dir, f'{name}.prof'),),
+                                   exitpriority=10)
+
+    def finish_profile(self):
+        # Dump the running profile now instead of at exit (a no-op for a finalizer
+        # inherited from a forked parent, which belongs to the parent's pid)
+        if self._dump is not None:
+            self._dump()
+            self._dump = None
+
+    def dump_profile(self, path):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(path)
+            self.profiler = None
+
+
+# One timer per process; pool workers get theirs from configure() as the initializer
+timer = StageTimer()
+
+
+def configure(path=None, profile_dir=None):
+    timer.path = path
+    if profile_dir:
+        timer.start_profile(profile_dir)
+
+
+def reset():
+    # Back to disabled, with any profile written out: for processes that run several
+    # scripts in turn (render_daemon.py)
+    timer.path = None
+    timer.finish_profile()
@@ -0,0 +1,217 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+from fill_values import FILL_THRESHOLD, declared_fills
+
+# Static land/ocean mask of a grid. The Year_N files mark land with the same fill
+# value on every day and in every variable (see Masked_data_generated/), so the
+# reductions can drop those cells once instead of carrying and re-testing them in
+# every mean: pack() turns (..., lat, lon) blocks into (..., n_ocean) arrays of the
+# ocean cells, reductions run on those, and unpack() puts the results back on the grid
+# with NaN over land.
+#
+# The mask is derived from the data and persisted per grid (in .static_mask/) by an
+# explicit step, run once after new year files arrive:
+#
+#   python static_mask.py                  # every Year_N under the current directory
+#   python static_mask.py --store years_store.nc
+#
+# It makes one full pass over each file's variables, confirms that each missing cell
+# holds the declared _FillValue and records which cells are ever valid. A file with
+# valid data outside the mask widens it, so packing never drops data; cells missing
+# only on some days stay in the ocean and count as missing there, as before. The
+# reductions pack only sources the mask lists as checked (path, mtime and size); any
+# other file, or a grid without a mask, is reduced on the full grid as before.
+#
+#   mask = region_mask(ncfile, ds, lat_slice, lon_slice)  # None if not checked
+#   season_fields = reduce_seasons(un, vn, mask=mask)
+
+VARIABLES = ('un', 'vn', 'pn')
+MASK_DIR = '.static_mask'
+CHUNK_DAYS = 32
+
+# Masks already loaded or checked in this process, by mask file
+_masks = {}
+
+
+def source_id(source):
+    # Identity of a source for the list of checked files: path, mtime and size, or the
+    # year's own stamp for (store, N) sources, like the cache keys
+    if isinstance(source, tuple):
+        from chunked_store import year_stamp
+        return year_stamp(*source)
+    st = os.stat(source)
+    return f"{os.path.abspath(source)}:{st.st_mtime_ns}:{st.st_size}"
+
+
+def grid_key(lat, lon):
+    blob = np.ascontiguousarray(lat, dtype=np.float64).tobytes() + b'|' + \
+        np.ascontiguousarray(lon, dtype=np.float64).tobytes()
+    return hashlib.sha1(blob).hexdigest()
+
+
+class StaticMask:
+    def __init__(self, lat, lon, ocean, always=None, sources=()):
+        self.lat = np.asarray(lat)
+        self.lon = np.asarray(lon)
+        # Cells valid on some day / on every day of the checked sources
+        self.ocean = np.asarray(ocean, dtype=bool)
+        self.always = self.ocean if always is None else np.asarray(always, dtype=bool)
+        self.cells = np.flatnonzero(self.ocean.ravel())
+        self.land = np.flatnonzero(~self.ocean.ravel())
+        self.sources = list(sources)
+
+    @property
+    def intermittent(self):
+        # Ocean cells missing on some days only
+        return int(np.count_nonzero(self.ocean & ~self.always))
+
+    @property
+    def land_fraction(self):
+        return self.land.size / self.ocean.size
+
+    def sub(self, lat_slice, lon_slice):
+        # The mask of a hyperslab of the grid (a region read)
+        return StaticMask(self.lat[lat_slice], self.lon[lon_slice], self.ocean[lat_slice, lon_slice],
+                          self.always[lat_slice, lon_slice], self.sources)
+
+    def pack(self, block):
+        # (..., lat, lon) -> (..., n_ocean); only for sources the mask has checked
+        flat = np.asarray(block).reshape(block.shape[:-2] + (-1,))
+        return flat[..., self.cells]
+
+    def unpack(self, packed, fill=np.nan):
+        # (..., n_ocean) -> (..., lat, lon), `fill` over land
+        out = np.full(packed.shape[:-1] + (self.ocean.size,), fill, dtype=packed.dtype)
+        out[..., self.cells] = packed
+        return out.reshape(packed.shape[:-1] + self.ocean.shape)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez_compressed(tmp_path, lat=self.lat, lon=self.lon, ocean=self.ocean, always=self.always,
+                            sources=json.dumps(self.sources))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            return cls(npz['lat'], npz['lon'], npz['ocean'], npz['always'], json.loads(str(npz['sources'])))
+
+
+def _raw(var, key):
+    # var[key] as stored: fills as written, no auto-masking
+    if not hasattr(var, 'set_auto_mask'):
+        return np.ma.getdata(var[key])
+    auto_mask = getattr(var, 'mask', True)
+    var.set_auto_mask(False)
+    try:
+        return var[key]
+    finally:
+        var.set_auto_mask(auto_mask)
+
+
+def scan(ds, variables=VARIABLES, chunk=CHUNK_DAYS):
+    # One pass over `variables`: per cell, whether it is valid on any / on every day
+    # of every variable, and per variable the missing values that are not its _FillValue
+    ever = always = None
+    mismatched = {}
+    for name in variables:
+        var = ds.variables[name]
+        fill = getattr(var, '_FillValue', None)
+        fills = declared_fills(var)
+        mismatched[name] = 0
+        for start in range(0, var.shape[0], chunk):
+            block = _raw(var, slice(start, min(start + chunk, var.shape[0])))
+            missing = ~(block < FILL_THRESHOLD)  # NaN counts as missing too
+            for value in fills:
+                missing |= block == value
+            if fill is not None:
+                wrong = missing & ~np.isnan(block) & (block != np.asarray(fill, block.dtype))
+                mismatched[name] += int(np.count_nonzero(wrong))
+            valid = ~missing
+            block_ever, block_always = valid.any(axis=0), valid.all(axis=0)
+            ever = block_ever if ever is None else ever | block_ever
+            always = block_always if always is None else always & block_always
+    return ever, always, mismatched
+
+
+def check_source(mask, source, ds, variables=VARIABLES):
+    # The mask widened to cover `source`, after checking its fill values
+    ever, always, mismatched = scan(ds, variables)
+    for name, count in mismatched.items():
+        if count:
+            print(f"Warning: {count} missing values of {name} in {source} are not its _FillValue "
+                  f"{ds.variables[name]._FillValue}")
+    lat = np.asarray(ds.variables['lat'][:])
+    lon = np.asarray(ds.variables['lon'][:])
+    if mask is None:
+        return StaticMask(lat, lon, ever, always, [source_id(source)])
+    widened = np.count_nonzero(ever & ~mask.ocean)
+    if widened:
+        print(f"Static mask widened by {widened} cells with data in {source}")
+    return StaticMask(lat, lon, mask.ocean | ever, mask.always & always, mask.sources + [source_id(source)])
+
+
+def mask_path(ds, mask_dir=MASK_DIR):
+    lat = np.asarray(ds.variables['lat'][:])
+    lon = np.asarray(ds.variables['lon'][:])
+    return os.path.join(mask_dir, f'mask_{grid_key(lat, lon)}.npz')
+
+
+def grid_mask(source, ds, mask_dir=MASK_DIR):
+    # The static mask of `ds`'s grid if it has checked `source`, else None
+    path = mask_path(ds, mask_dir)
+    mask = _masks.get(path)
+    if mask is None or source_id(source) not in mask.sources:
+        if not os.path.exists(path):
+            return None
+        mask = _masks[path] = StaticMask.load(path)  # checked by another process since
+    return mask if source_id(source) in mask.sources else None
+
+
+def region_mask(source, ds, lat_slice=slice(None), lon_slice=slice(None), mask_dir=MASK_DIR):
+    # grid_mask cut to the hyperslab a reduction reads, or None
+    mask = grid_mask(source, ds, mask_dir)
+    return None if mask is None else mask.sub(lat_slice, lon_slice)
+
+
+def check_grid(source, ds, mask_dir=MASK_DIR, variables=VARIABLES):
+    # The static mask of `ds`'s grid, built or widened to cover `source` unless it
+    # already has
+    path = mask_path(ds, mask_dir)
+    mask = StaticMask.load(path) if os.path.exists(path) else None
+    if mask is None or source_id(source) not in mask.sources:
+        mask = check_source(mask, source, ds, variables)
+        mask.save(path)
+    _masks[path] = mask
+    return mask
+
+
+if __name__ == '__main__':
+    from multi_year_clim import find_year_files
+    from nc_region import BACKEND_HELP, BACKENDS, open_dataset, year_source
+
+    parser = argparse.ArgumentParser(description='Derive and check the static land/ocean mask of the Year_N files.')
+    parser.add_argument('years', nargs='*', help='Year numbers to check (default: every Year_N under --root)')
+    parser.add_argument('--root', default='.', help='Directory containing the Year_N folders')
+    parser.add_argument('--store', default=None, help='Check the years of this chunked store instead')
+    parser.add_argument('--mask-dir', default=MASK_DIR, help=f'Where the masks are kept (default: {MASK_DIR})')
+    parser.add_argument('--backend', choices=BACKENDS, default='netcdf4',
+                        help=BACKEND_HELP)
+    args = parser.parse_args()
+
+    if args.years:
+        sources = [year_source(year, args.store) for year in args.years]
+    elif args.store:
+        from chunked_store import store_years
+        sources = [source for _, source in store_years(args.store)]
+    else:
+        sources = [path for _, path in find_year_files(args.root)]
+    for source in sources:
+        with open_dataset(source, args.backend) as ds:
+            mask = check_grid(source, ds, args.mask_dir)
+        print(f"{source}: {mask.cells.size} ocean cells, {mask.land.size} land "
+              f"({100 * mask.land_fraction:.1f}%), {mask.intermittent} intermittently missing")
@@ -0,0 +1,134 @@
+import numpy as np
+from collections import deque
+from derived_fields import QUIVER_STEP, derive
+from fill_values import read_nan, split_valid, nan_mean
+from static_mask import grid_mask
+from stage_timer import timer
+
+
+def monthly_windows(day_init_min=1, day_final_max=364, width=30):
+    # The 30-day windows plotted by plot_vector_scalar_yearwise, as inclusive (day_init, day_final)
+    windows = []
+    for day_init in range(day_init_min, day_final_max + 1, width):
+        day_final = day_init + width - 1
+        if day_final > day_final_max or day_init == 331:
+            day_final = day_final_max
+        if day_init == 361:
+            continue
+        windows.append((day_init, day_final))
+    return windows
+
+
+def running_windows(width, stride=1, day_init_min=1, day_final_max=364):
+    # Sliding `width`-day windows every `stride` days, as inclusive (day_init, day_final)
+    return [(day_init, day_init + width - 1)
+            for day_init in range(day_init_min, day_final_max - width + 2, stride)]
+
+
+def window_means(variables, windows, scale=1, chunk=31, mask=None):
+    # Means of every variable over every [start, stop) window along the time axis.
+    # `variables` maps names to (time, lat, lon) arrays or netCDF4 variables. The time
+    # axis is cut at every window edge and each segment is read and summed exactly
+    # once (at most `chunk` days at a time), so any number of (possibly overlapping)
+    # windows costs a single pass. With a static_mask.StaticMask each segment is packed
+    # to its ocean cells as it is read.
+    for start, stop in windows:
+        if stop <= start:
+            raise ValueError(f"Empty averaging window [{start}, {stop}).")
+    if not windows:
+        return []
+    pack = mask.pack if mask is not None else (lambda block: block)
+    edges = sorted({edge for window in windows for edge in window})
+    position = {edge: k for k, edge in enumerate(edges)}
+
+    results = [{} for _ in windows]
+    for name, var in variables.items():
+        # Prefix sums at each edge: prefix[k] = sum of days edges[0]..edges[k]-1
+        sums = counts = None
+        prefix_sums, prefix_counts = [], []
+        for k, edge in enumerate(edges):
+            for start in range(edges[k - 1], edge, chunk) if k > 0 else ():
+                filled, valid = split_valid(pack(read_nan(var, slice(start, min(start + chunk, edge)))))
+                segment_sums = filled.sum(axis=0, dtype=np.float64)
+                segment_counts = valid.sum(axis=0)
+                sums = segment_sums if sums is None else sums + segment_sums
+                counts = segment_counts if counts is None else counts + segment_counts
+            prefix_sums.append(sums)
+            prefix_counts.append(counts)
+
+        for result, (start, stop) in zip(results, windows):
+            a, b = position[start], position[stop]
+            window_sums = prefix_sums[b] if a == 0 else prefix_sums[b] - prefix_sums[a]
+            window_counts = prefix_counts[b] if a == 0 else prefix_counts[b] - prefix_counts[a]
+            mean = nan_mean(window_sums, window_counts, scale)
+            result[name] = mean if mask is None else mask.unpack(mean)
+    return results
+
+
+def window_products(fields, uv_scale=10, step=QUIVER_STEP):
+    # A window's U/V/P means plus the derived products plot_vector_scalar_yearwise draws
+    # (speed and decimated arrows in dm/s, scaled in float64 like the plots always did)
+    return {**fields, **derive(fields['U'].astype(np.float64), fields['V'].astype(np.float64),
+                               scale=uv_scale, step=step)}
+
+
+def load_window_products(source, ds, windows, cache=None):
+    # window_products for every inclusive (day_init, day_final) window of one year
+    # (`ds` open on `source`). All missing windows come from a single pass over the
+    # year's un/vn/pn, and each window is cached on disk under `source`.
+    keys = [None] * len(windows)
+    means = [None] * len(windows)
+    if cache is not None:
+        keys = [cache.key(source, 'un,vn,pn', None, range(day_init, day_final + 1), uv_scale=10, step=QUIVER_STEP)
+                for day_init, day_final in windows]
+        with timer.stage('cache_load'):
+            means = [cache.load(key) for key in keys]
+
+    missing = [i for i, fields in enumerate(means) if fields is None]
+    if missing:
+        bounds = [(windows[i][0], windows[i][1] + 1) for i in missing]
+        # Land cells are dropped as the days are read, once static_mask.py has checked the file
+        with timer.stage('static_mask'):
+            mask = grid_mask(source, ds)
+        variables = {'U': ds.variables['un'], 'V': ds.variables['vn'], 'P': ds.variables['pn']}
+        with timer.stage('window_means'):
+            computed = window_means(variables, bounds, mask=mask)
+        for i, fields in zip(missing, computed):
+            means[i] = fields = window_products(fields)
+            if cache is not None:
+                with timer.stage('cache_store'):
+                    cache.store(keys[i], fields)
+    return means
+
+
+def running_means(variables, width, stride=1, scale=1, start=0, stop=None, chunk=31, mask=None):
+    # Sliding `width`-day means of every variable, in one streamed pass: yields
+    # (start, stop, {name: mean}) for the [start, start + width) windows, every `stride`
+    # days. Days are read `chunk` at a time and only the prefix sums of the last
+    # `width` days are kept, so the cost is O(T) and memory does not grow with T.
+    if width < 1 or stride < 1:
+        raise ValueError("Running mean width and stride must be at least 1.")
+    pack = mask.pack if mask is not None else (lambda block: block)
+    n_days = min(var.shape[0] for var in variables.values())
+    stop = n_days if stop is None else min(stop, n_days)
+    # Prefix sums and counts after each of the last width + 1 days, per variable
+    prefixes = {name: deque(maxlen=width + 1) for name in variables}
+    for chunk_start in range(start, stop, chunk):
+        chunk_stop = min(chunk_start + chunk, stop)
+        blocks = {name: split_valid(pack(read_nan(var, slice(chunk_start, chunk_stop))))
+                  for name, var in variables.items()}
+        for offset in range(chunk_stop - chunk_start):
+            for name, (filled, valid) in blocks.items():
+                if not prefixes[name]:
+                    prefixes[name].append((np.zeros(filled.shape[1:]), np.zeros(valid.shape[1:], dtype=np.int64)))
+                sums, counts = prefixes[name][-1]
+                prefixes[name].append((sums + filled[offset], counts + valid[offset]))
+            window_start = chunk_start + offset + 1 - width
+            if window_start < start or (window_start - start) % stride:
+                continue
+            means = {}
+            for name, prefix in prefixes.items():
+                (first_sums, first_counts), (last_sums, last_counts) = prefix[0], prefix[-1]
+                mean = nan_mean(last_sums - first_sums, last_counts - first_counts, scale)
+                means[name] = mean if mask is None else mask.unpack(mean)
+            yield window_start, window_start + width, means